@@ -6,7 +6,7 @@ from loguru import logger
 
 from models.load_model import load_model, load_model_ollama
 from models.router.router import SequenceClassificationRouter
-from models.retrieve.retriever import Retriever, Retriever_Milvus
+from models.retrieve.retriever import Retriever, Retriever_Milvus, Retriever_Flat
 from models.model import RAGModel
 
 BATCH_SIZE = 20
@@ -109,18 +109,30 @@ if __name__ == "__main__":
     embedding_model_path = "models/retrieve/embedding_models/bge-m3"
     reranker_model_path = "models/retrieve/reranker_models/bge-reranker-v2-m3"
 
-    retriever = Retriever(10, 5, embedding_model_path, reranker_model_path, rerank=True)
+    # CPUs used by Ray for HTML extraction
+    num_cpus = 16
+    # "torch", or "onnx" on nodes without GPU: the embedding, reranker and router models run as int8 ONNX exports on CPU
+    backend = "torch"
+    num_threads = 8
+    # Reranker scores of (query, chunk) pairs are kept across runs
+    rerank_cache_path = "models/retrieve/cache/rerank.sqlite"
+    retriever = Retriever(10, 5, embedding_model_path, reranker_model_path, rerank=True, num_cpus=num_cpus, rerank_cache_path=rerank_cache_path, backend=backend, num_threads=num_threads)
     # To use the retriever with Milvus, uncomment the following lines and comment the previous line
     # collection_name = "bge_m3_crag_task_3_dev_v3_llamaindex"
     # uri = "http://localhost:19530"
     # uri = ".models/retrieve/milvus.db"
-    # retriever = Retriever_Milvus(10, 5, collection_name, uri, embedding_model_path, reranker_model_path, rerank=True)
+    # retriever = Retriever_Milvus(10, 5, collection_name, uri, embedding_model_path, reranker_model_path, rerank=True, rerank_cache_path=rerank_cache_path, backend=backend, num_threads=num_threads)
+    # Or with a local flat index built by build_vector_db (no server needed)
+    # index_path = "models/retrieve/flat_index/bge_m3_crag_task_3_dev_v3_llamaindex"
+    # retriever = Retriever_Flat(10, 5, index_path, embedding_model_path, reranker_model_path, rerank=True, rerank_cache_path=rerank_cache_path, backend=backend, num_threads=num_threads)
 
     # Load the domain router
     domain_router = SequenceClassificationRouter(
         model_path="models/router/bge-m3/domain",
         classes=["finance", "music", "movie", "sports", "open"],
         device_map="auto",
+        backend=backend,
+        num_threads=num_threads,
     )
 
     # Load the dynamic router
@@ -131,6 +143,8 @@ if __name__ == "__main__":
             model_path="models/router/bge-m3/dynamic",
             classes=['static', 'slow-changing', 'fast-changing', 'real-time'],
             device_map="auto",
+            backend=backend,
+            num_threads=num_threads,
         )
     # Initialize the RAG model
         rag_model = RAGModel(chat_model, retriever, domain_router, dynamic_router, use_kg=use_kg)
@@ -139,6 +153,10 @@ if __name__ == "__main__":
     # Generate predictions
     dataset_path = "example_data/dev_data.jsonl.bz2"
     queries, ground_truths, predictions = generate_predictions(dataset_path, rag_model)
+    if getattr(retriever, "rerank", False):
+        logger.info(f"Reranker cache: {retriever.reranker.stats()}")
+    if use_kg:
+        logger.info(f"NER cache: {rag_model.api.ner_cache.stats()}")
     
     # Save the predictions
     output_path = f"results/{model_name}_predictions.jsonl"
@@ -0,0 +1,88 @@
+# Throughput of the PyTorch and ONNX (int8, CPU) backends of the embedding, reranker and router models
+# Run from the root of the repository:
+#   python -m models.benchmark_onnx --device cpu --num-threads 4 8 16
+import bz2
+import json
+import time
+import argparse
+import numpy as np
+import torch
+from models.retrieve.retriever import load_embedding_model
+from models.retrieve.reranker import BatchReranker
+from models.router.router import SequenceClassificationRouter
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare the throughput of the torch and onnx backends")
+    parser.add_argument("--dataset", default="example_data/dev_data.jsonl.bz2")
+    parser.add_argument("--embedding-model", default="models/retrieve/embedding_models/bge-m3")
+    parser.add_argument("--reranker-model", default="models/retrieve/reranker_models/bge-reranker-v2-m3")
+    parser.add_argument("--router-model", default="models/router/bge-m3/domain")
+    parser.add_argument("--router-classes", nargs="+", default=["finance", "music", "movie", "sports", "open"])
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu", help="device of the torch backend")
+    parser.add_argument("--num-threads", type=int, nargs="+", default=[8], help="intra-op thread counts of the onnx backend")
+    parser.add_argument("--num-texts", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=32)
+    return parser.parse_args()
+
+
+def load_texts(dataset, num_texts):
+    """
+    Queries, and search result snippets as chunks.
+    """
+    queries, chunks = [], []
+    with bz2.open(dataset, "rt") as f:
+        for line in f:
+            data = json.loads(line)
+            queries.append(data["query"])
+            chunks.extend(result["page_snippet"] for result in data["search_results"] if result["page_snippet"])
+            if len(queries) >= num_texts and len(chunks) >= num_texts:
+                break
+    return queries[:num_texts], chunks[:num_texts]
+
+
+def timed(fn):
+    fn()  # warm up
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    args = parse_args()
+    queries, chunks = load_texts(args.dataset, args.num_texts)
+    pairs = list(zip(queries, chunks))
+    configs = [("torch", None)] + [("onnx", num_threads) for num_threads in args.num_threads]
+    rows = []
+    reference = {}
+    for backend, num_threads in configs:
+        name = f"{backend} ({args.device})" if backend == "torch" else f"onnx int8 ({num_threads} threads)"
+
+        embedding_model = load_embedding_model(args.embedding_model, args.device, args.batch_size, backend, num_threads)
+        embeddings, seconds = timed(lambda: np.asarray(embedding_model.get_text_embedding_batch(chunks), dtype=np.float32))
+        agreement = np.mean(np.sum(embeddings * reference["embedding"], axis=1)) if "embedding" in reference else 1.0
+        reference.setdefault("embedding", embeddings)
+        rows.append(("embedding", name, len(chunks) / seconds, f"cosine {agreement:.4f}"))
+        del embedding_model
+
+        reranker = BatchReranker(args.reranker_model, top_n=5, device=args.device, batch_size=args.batch_size, backend=backend, num_threads=num_threads)
+        scores, seconds = timed(lambda: reranker.predict(pairs))
+        agreement = np.mean(np.abs(scores - reference["reranker"])) if "reranker" in reference else 0.0
+        reference.setdefault("reranker", scores)
+        rows.append(("reranker", name, len(pairs) / seconds, f"mean |score diff| {agreement:.4f}"))
+        del reranker
+
+        router = SequenceClassificationRouter(args.router_model, args.router_classes, backend=backend, num_threads=num_threads)
+        routes, seconds = timed(lambda: router.route_batch(queries, max_batch_size=args.batch_size))
+        agreement = np.mean([a == b for a, b in zip(routes, reference["router"])]) if "router" in reference else 1.0
+        reference.setdefault("router", routes)
+        rows.append(("router", name, len(queries) / seconds, f"same class {agreement:.4f}"))
+        del router
+
+    print(f"{'model':<12}{'backend':<28}{'items/s':>10}  agreement with {configs[0][0]}")
+    for model, name, throughput, agreement in sorted(rows, key=lambda row: row[0]):
+        print(f"{model:<12}{name:<28}{throughput:>10.1f}  {agreement}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A thread-safe in-process LRU cache with a bound on the number of entries and an optional time-to-live per entry.
+    An optional `backend` (e.g. SQLiteCache) is consulted on misses and written through on sets.
+
+    Example:
+        cache = LRUCache(maxsize=1024, ttl=3600, backend=SQLiteCache("cache.sqlite"))
+        cache.set("key", "value", ttl=60)
+        cache.get("key")
+    """
+    def __init__(self, maxsize=1024, ttl=None, backend=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expire, value = item
+                if expire is None or expire > time.time():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+        if self.backend is not None:
+            # The entry keeps the expiry time it was stored with in the backend
+            entry = self.backend.get_entry(key)
+            if entry is not None:
+                value, expire = entry
+                with self._lock:
+                    self.hits += 1
+                self._store(key, value, expire)
+                return value
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self._set(key, value, ttl)
+        if self.backend is not None:
+            self.backend.set(key, value, ttl=ttl)
+
+    def set_many(self, items, ttl=None):
+        """
+        Set all the items of the dict, with a single write (transaction) to the backend.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expire = time.time() + ttl if ttl is not None else None
+        for key, value in items.items():
+            self._store(key, value, expire)
+        if self.backend is not None and len(items) > 0:
+            self.backend.set_many(items, ttl=ttl)
+
+    def _set(self, key, value, ttl):
+        self._store(key, value, time.time() + ttl if ttl is not None else None)
+
+    def _store(self, key, value, expire):
+        with self._lock:
+            self._data[key] = (expire, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else 0.0,
+            "size": len(self._data),
+        }
+        if self.backend is not None:
+            stats["backend"] = self.backend.stats()
+        return stats
+
+
+class SQLiteCache:
+    """
+    A persistent cache stored in a SQLite database. Values are JSON serialized and optionally zlib compressed.
+    The database runs in WAL mode with one connection per thread and process, so it can be shared by concurrent
+    readers and writers (threads, Ray workers). If `max_bytes` is set, the least recently used entries are evicted
+    once the stored values exceed it.
+    """
+    def __init__(self, path, ttl=None, max_bytes=None, compress=True, timeout=60):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._num_sets = 0
+        if os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=self.timeout)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, size INTEGER, expire REAL, access REAL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_access ON cache (access)")
+        conn.commit()
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _dumps(self, value):
+        data = json.dumps(value).encode("utf-8")
+        return zlib.compress(data) if self.compress else data
+
+    def _loads(self, data):
+        data = zlib.decompress(data) if self.compress else data
+        return json.loads(data.decode("utf-8"))
+
+    def get(self, key, default=None):
+        entry = self.get_entry(key)
+        return default if entry is None else entry[0]
+
+    def get_entry(self, key):
+        """
+        (value, expire) of the key, expire being an absolute time (None if it never expires), or None if missing.
+        """
+        conn = self._connect()
+        row = conn.execute("SELECT value, expire, access FROM cache WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None:
+            self.misses += 1
+            return None
+        value, expire, access = row
+        if expire is not None and expire <= now:
+            with conn:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+        # Refresh the access time lazily to avoid a write on every read
+        if now - access > 60:
+            with conn:
+                conn.execute("UPDATE cache SET access = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return self._loads(value), expire
+
+    def get_many(self, keys):
+        """
+        Returns a dict of the keys found in the cache.
+        """
+        conn = self._connect()
+        results = {}
+        stale = []
+        now = time.time()
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            rows = conn.execute(
+                f"SELECT key, value, expire, access FROM cache WHERE key IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            for key, value, expire, access in rows:
+                if expire is None or expire > now:
+                    results[key] = self._loads(value)
+                    if now - access > 60:
+                        stale.append((now, key))
+        # Same lazy access time refresh as get, in one transaction
+        if len(stale) > 0:
+            with conn:
+                conn.executemany("UPDATE cache SET access = ? WHERE key = ?", stale)
+        self.hits += len(results)
+        self.misses += len(keys) - len(results)
+        return results
+
+    def set(self, key, value, ttl=None):
+        self.set_many({key: value}, ttl=ttl)
+
+    def set_many(self, items, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        expire = now + ttl if ttl is not None else None
+        rows = []
+        for key, value in items.items():
+            data = self._dumps(value)
+            rows.append((key, data, len(data), expire, now))
+        conn = self._connect()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO cache (key, value, size, expire, access) VALUES (?, ?, ?, ?, ?)", rows)
+        self._num_sets += len(rows)
+        if self.max_bytes is not None and self._num_sets >= 100:
+            self._num_sets = 0
+            self.evict()
+
+    def evict(self):
+        """
+        Delete expired entries, then the least recently used ones until the cache is below 90% of `max_bytes`.
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM cache WHERE expire IS NOT NULL AND expire <= ?", (time.time(),))
+            if self.max_bytes is None:
+                return
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            to_free = total - int(self.max_bytes * 0.9)
+            keys = []
+            for key, size in conn.execute("SELECT key, size FROM cache ORDER BY access"):
+                keys.append((key,))
+                to_free -= size
+                if to_free <= 0:
+                    break
+            conn.executemany("DELETE FROM cache WHERE key = ?", keys)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else 0.0,
+        }
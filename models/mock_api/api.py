@@ -1,22 +1,60 @@
+from models.cache import LRUCache, SQLiteCache
+from models.mock_api.pycragapi import CRAG, AsyncCRAG
+from models.mock_api.gazetteer import Gazetteer
 from models.mock_api.tools.financetools import FinanceTools
 from models.mock_api.tools.musictools import MusicTools
 from models.mock_api.tools.movietools import MovieTools
 from models.mock_api.tools.sportstools import SportsTools
 from models.mock_api.tools.generaltools import find_date_from_text, find_date_from_text_all, extract_date, extract_date_, get_last_week_dates, get_last_month_dates, get_this_week_dates, get_this_month_dates
-from models.mock_api.prompts import NER_MOVIE_SYSTEM_PROMPT, NER_MOVIE_USER_PROMPT, NER_MUSIC_SYSTEM_PROMPT, NER_MUSIC_USER_PROMPT, NER_SPORTS_SYSTEM_PROMPT, NER_SPORTS_USER_PROMPT, NER_FINANCE_SYSTEM_PROMPT, NER_FINANCE_USER_PROMPT, NER_OPEN_SYSTEM_PROMPT, NER_OPEN_USER_PROMPT
+from models.mock_api.prompts import NER_MOVIE_SYSTEM_PROMPT, NER_MOVIE_USER_PROMPT, NER_MUSIC_SYSTEM_PROMPT, NER_MUSIC_USER_PROMPT, NER_SPORTS_SYSTEM_PROMPT, NER_SPORTS_USER_PROMPT, NER_FINANCE_SYSTEM_PROMPT, NER_FINANCE_USER_PROMPT, NER_OPEN_SYSTEM_PROMPT, NER_OPEN_USER_PROMPT, NER_PROMPT_VERSION
 import re
+import json
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
 from collections import defaultdict
 import datetime
+import numpy as np
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.output_parsers import StrOutputParser
 
+# Lines "entity_name (category)" of the NER answers, and the categories kept, per domain
+NER_PATTERNS = {
+    "movie": (re.compile(r'^(.*?)(\((person|movie)\))', re.MULTILINE), ['person', 'movie']),
+    "finance": (re.compile(r'^(.*?)(\((company|symbol)\))', re.MULTILINE), ['company', 'symbol']),
+    "music": (re.compile(r'^(.*?)(\((person|song|band)\))', re.MULTILINE), ['person', 'song', 'band']),
+    "sports": (re.compile(r'^(.*?)(\((nba team|soccer team|nba player|soccer player)\))', re.MULTILINE), ['nba team', 'soccer team', 'nba player', 'soccer player']),
+    "open": (re.compile(r'^(.*?)(\((person|location|orgnization|product|event)\))', re.MULTILINE), ['person', 'location', 'orgnization', 'product', 'event']),
+}
+LEADING_NON_ALPHA = re.compile(r'^[^a-zA-Z]+')
+NER_CACHE_PATH = "models/mock_api/cache/ner.sqlite"
+
 class MockAPI:
-    def __init__(self, chat_model):
-        self.finance_tool = FinanceTools()
-        self.music_tool = MusicTools()
-        self.movie_tool = MovieTools()
-        self.sports_tool = SportsTools()
+    def __init__(self, chat_model, api=None, async_api=None, cache_size=1024, cache_path=None, ner_cache_size=4096, ner_cache_path=NER_CACHE_PATH, kg_num_workers=8, kg_timeout=30):
+        # All the tools share one client (and its connection pool), both clients share one response cache
+        self.cache = LRUCache(maxsize=cache_size, backend=SQLiteCache(cache_path) if cache_path is not None else None)
+        # With a KG deadline, a request (with its retry) gives up well before it, so the workers of a batch come back
+        if kg_timeout is not None:
+            request_timeout = {'timeout': (min(5, kg_timeout / 8), kg_timeout / 4), 'max_retries': 1}
+            async_request_timeout = {'timeout': kg_timeout / 2}
+        else:
+            request_timeout, async_request_timeout = {}, {}
+        self.api = CRAG(cache=self.cache, **request_timeout) if api is None else api
+        self.async_api = AsyncCRAG(cache=self.cache, **async_request_timeout) if async_api is None else async_api
+        self.finance_tool = FinanceTools(self.api)
+        self.music_tool = MusicTools(self.api, self.async_api)
+        self.movie_tool = MovieTools(self.api, self.async_api)
+        self.sports_tool = SportsTools(self.api, self.async_api)
+        # Finance and sports queries naming only known teams, companies or tickers skip the LLM NER
+        self.gazetteer = Gazetteer(self.finance_tool, self.sports_tool)
         self.ner_chain = self.format_ner_prompt | chat_model | StrOutputParser()
+        # The LLM NER answers are kept across runs, keyed by query, domain, model and prompt version
+        self.ner_model_name = getattr(chat_model, "model_name", None) or getattr(chat_model, "model", None) or type(chat_model).__name__
+        self.ner_cache = LRUCache(maxsize=ner_cache_size, backend=SQLiteCache(ner_cache_path) if ner_cache_path is not None else None)
+        # The KG info of the queries of a batch is assembled concurrently, the queries not done kg_timeout seconds
+        # after the batch was submitted get partial info (their entities and dates) and no longer hold up the batch
+        self.kg_num_workers = kg_num_workers
+        self.kg_timeout = kg_timeout
 
     def format_ner_prompt(self, input):
         query = input['query']
@@ -51,31 +89,10 @@ class MockAPI:
     
     def ner_output_parser(self, output, domain):
         results = defaultdict(set)
-        if domain == "movie":
-            pattern = re.compile(r'^(.*?)(\((person|movie)\))', re.MULTILINE)
-            matches = pattern.finditer(output)
-            keys = ['person', 'movie']
-        if domain == "finance":
-            pattern = re.compile(r'^(.*?)(\((company|symbol)\))', re.MULTILINE)
-            matches = pattern.finditer(output)
-            keys = ['company', 'symbol']
-        if domain == "music":
-            pattern = re.compile(r'^(.*?)(\((person|song|band)\))', re.MULTILINE)
-            matches = pattern.finditer(output)
-            keys = ['person', 'song', 'band']
-        if domain == "sports":
-            pattern = re.compile(r'^(.*?)(\((nba team|soccer team|nba player|soccer player)\))', re.MULTILINE)
-            matches = pattern.finditer(output)
-            keys = ['nba team', 'soccer team', 'nba player', 'soccer player']
-        if domain == "open":
-            pattern = re.compile(r'^(.*?)(\((person|location|orgnization|product|event)\))', re.MULTILINE)
-            matches = pattern.finditer(output)
-            keys = ['person', 'location', 'orgnization', 'product', 'event']
-
-        for match in matches:
-            text = match.group(1).strip()
+        pattern, keys = NER_PATTERNS.get(domain, NER_PATTERNS["open"])
+        for match in pattern.finditer(output):
             # 删除所有非字母字符开头的部分
-            text = re.sub(r'^[^a-zA-Z]+', '', text)
+            text = LEADING_NON_ALPHA.sub('', match.group(1).strip())
             if 'none' in text.lower():
                 continue
             if match.group(3) in keys:
@@ -84,15 +101,33 @@ class MockAPI:
         for key in keys:
             results[key] = list(results[key])
         return results
-        
+
+    def get_ner_key(self, query, domain):
+        query = " ".join(query.lower().split()).rstrip("?.! ")
+        key = json.dumps([NER_PROMPT_VERSION, self.ner_model_name, domain, query])
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
 
     def ner(self, queries, domains):
-        inputs = [{'query': query, 'domain': domain} for query, domain in zip(queries, domains)]
-        responses = self.ner_chain.batch(inputs)
-        results = []
-        for i, response in enumerate(responses):
-            results.append(self.ner_output_parser(response, domains[i]))
-        return results 
+        results = [self.gazetteer.match(query, domain) for query, domain in zip(queries, domains)]
+        # The other queries use the cached LLM answers, the misses (deduplicated) go through ner_chain
+        misses = {}
+        for i, result in enumerate(results):
+            if result is not None:
+                continue
+            key = self.get_ner_key(queries[i], domains[i])
+            response = self.ner_cache.get(key)
+            if response is not None:
+                results[i] = self.ner_output_parser(response, domains[i])
+            else:
+                misses.setdefault(key, []).append(i)
+        if len(misses) > 0:
+            inputs = [{'query': queries[idx[0]], 'domain': domains[idx[0]]} for idx in misses.values()]
+            responses = self.ner_chain.batch(inputs)
+            for (key, idx), response in zip(misses.items(), responses):
+                self.ner_cache.set(key, response)
+                for i in idx:
+                    results[i] = self.ner_output_parser(response, domains[i])
+        return results
     
     def name_entity_match(self, ner_result, domain):
         matched_entities = defaultdict(list)
@@ -111,11 +146,13 @@ class MockAPI:
                     matched_entities['symbol'].append(symbol.upper())
         if domain == "music":
             for name in ner_result['person']:
-                if self.music_tool.get_artist_name(name) is not None:
-                    matched_entities['person'].append(self.music_tool.get_artist_name(name))
+                artist_name = self.music_tool.get_artist_name(name)
+                if artist_name is not None:
+                    matched_entities['person'].append(artist_name)
             for name in ner_result['song']:
-                if self.music_tool.get_song_name(name) is not None:
-                    matched_entities['song'].append(self.music_tool.get_song_name(name))
+                song_name = self.music_tool.get_song_name(name)
+                if song_name is not None:
+                    matched_entities['song'].append(song_name)
             for name in ner_result['band']:
                 matched_entities['band'].append(name)
         if domain == "movie":
@@ -189,12 +226,14 @@ class MockAPI:
             person_info = self.movie_tool.get_person_info_by_id(person_id)
             info += f"#### Some information of {person_info['name']}\n"
             info += f"- Birthday: {person_info['birthday']}\n"
+            # The titles of the whole filmography are fetched in one request
+            filmography = person_info.get('acted_movies', []) + person_info.get('directed_movies', [])
+            titles = dict(zip(filmography, self.movie_tool.get_movies_info_by_ids(filmography, fields=['title', 'original_title'])))
             if 'acted_movies' in person_info:
                 acted_movies = person_info['acted_movies']
                 if len(acted_movies) > 0:
                     info += f"- Acted {len(acted_movies)} Movies:\n"
-                    for movie in acted_movies:
-                        movie = self.movie_tool.get_movie_info_by_id(movie)
+                    for movie in [titles[movie_id] for movie_id in acted_movies]:
                         if movie is None:
                             continue
                         if movie['title'] == movie['original_title']:
@@ -205,8 +244,7 @@ class MockAPI:
                 directed_movies = person_info['directed_movies']
                 if len(directed_movies) > 0:
                     info += f"- Directed {len(directed_movies)} Movies:\n"
-                    for movie in directed_movies:
-                        movie = self.movie_tool.get_movie_info_by_id(movie)
+                    for movie in [titles[movie_id] for movie_id in directed_movies]:
                         if movie is None:
                             continue
                         if movie['title'] == movie['original_title']:
@@ -288,8 +326,8 @@ class MockAPI:
                 date2work = defaultdict(list)
                 dates = set()
                 works = []
-                for work in work_list:
-                    work_release_date = self.music_tool.get_song_release_date(work)
+                work_release_dates = self.music_tool.get_songs_release_date(work_list)
+                for work, work_release_date in zip(work_list, work_release_dates):
                     if work_release_date is not None and work_release_date < query_date:
                         date2work[work_release_date].append(work)
                         dates.add(work_release_date)
@@ -415,34 +453,34 @@ class MockAPI:
 
     def get_symbol_stock_dates_info(self, symbol, dates, date_str, query):
         info = ""
-        stock_dates_info = [self.finance_tool.get_price(symbol, date) for date in dates]
-        opens = [stock_date_info['Open'] for stock_date_info in stock_dates_info if stock_date_info is not None]
-        closes = [stock_date_info['Close'] for stock_date_info in stock_dates_info if stock_date_info is not None]
-        highs = [stock_date_info['High'] for stock_date_info in stock_dates_info if stock_date_info is not None]
-        lows = [stock_date_info['Low'] for stock_date_info in stock_dates_info if stock_date_info is not None]
-        volumes = [stock_date_info['Volume'] for stock_date_info in stock_dates_info if stock_date_info is not None]
-        
+        series = self.finance_tool.get_price_series(symbol)
+        if series is None:
+            return ""
+        idx = series.take(dates)
+        if len(idx) == 0:
+            return ""
+        opens = series.column('Open', idx)
+        closes = series.column('Close', idx)
+        highs = series.column('High', idx)
+        lows = series.column('Low', idx)
+        volumes = series.column('Volume', idx)
+
         # 过滤掉 0.01
-        for i in range(len(opens)):
-            if opens[i] == 0.01 or closes[i] == 0.01 or highs[i] == 0.01 or lows[i] == 0.01:
-                return ""
-        if len(opens) == 0:
+        if np.any((opens == 0.01) | (closes == 0.01) | (highs == 0.01) | (lows == 0.01)):
             return ""
 
-        # 先保留两位小数
-        opens = [round(open_, 2) for open_ in opens]
-        closes = [round(close, 2) for close in closes]
-        highs = [round(high, 2) for high in highs]
-        lows = [round(low, 2) for low in lows]
+        # 先保留两位小数 (Python round: np.round rounds some halves differently, e.g. 2.675)
+        opens, closes, highs, lows = ([round(price, 2) for price in prices.tolist()] for prices in (opens, closes, highs, lows))
+        volumes = volumes.tolist()
 
-        average_open = sum(opens) / len(opens) if len(opens) > 0 else 0
-        average_close = sum(closes) / len(closes) if len(closes) > 0 else 0
-        average_high = sum(highs) / len(highs) if len(highs) > 0 else 0
-        average_low = sum(lows) / len(lows) if len(lows) > 0 else 0
-        average_volume = sum(volumes) / len(volumes) if len(volumes) > 0 else 0
+        average_open = sum(opens) / len(opens)
+        average_close = sum(closes) / len(closes)
+        average_high = sum(highs) / len(highs)
+        average_low = sum(lows) / len(lows)
+        average_volume = sum(volumes) / len(volumes)
         total_volume = sum(volumes)
-        highest = max(highs) if len(highs) > 0 else 0
-        lowest = min(lows) if len(lows) > 0 else 0
+        highest = max(highs)
+        lowest = min(lows)
         overall_rise = closes[-1] - opens[0]
         company_name = self.finance_tool.symbol2name[symbol]
         if "average" not in query and "basis" not in query and "mean" not in query and "total" not in query and "daily" not in query:
@@ -470,24 +508,19 @@ class MockAPI:
         close_higher = []
         open_lower = []
         close_lower = []
-        trading_days = self.finance_tool.get_price_history(symbol)
-        if trading_days is not None:
-            trading_days = list(trading_days.keys())
-            trading_days.sort(reverse=True) 
-            dates = [date for date in dates if date + " 00:00:00 EST" in trading_days]
+        series = self.finance_tool.get_price_series(symbol)
+        if series is not None:
+            dates = [date for date in dates if series.index_on(date) is not None]
             if len(dates) == 0:
                 return ""
-            last_date = None
-            for trading_day in trading_days:
-                if trading_day[:10] < min(dates):
-                    last_date = trading_day[:10]
-                    break
-            if last_date is None:
+            last_index = series.index_before(min(dates))
+            if last_index is None:
                 return ""
+            last_date = series.date_at(last_index)
             dates.sort()
             for date in dates:
-                stock_info = self.finance_tool.get_price(symbol, date)
-                last_stock_info = self.finance_tool.get_price(symbol, last_date)
+                stock_info = series.price_on(date)
+                last_stock_info = series.price_on(last_date)
                 if stock_info is not None and last_stock_info is not None:
                     if round(stock_info['Open'],2) > round(last_stock_info['Close'],2):
                         open_higher.append(date)
@@ -709,13 +742,15 @@ class MockAPI:
                 pass
             else:
                 year = query_date[:4]
-                date = f"{year}-01-01"
                 for symbol in symbols:
                     company_name = self.finance_tool.symbol2name[symbol]
                     stock_info = None
-                    while date < query_date and stock_info is None:
-                        stock_info = self.finance_tool.get_price(symbol, date)
-                        date = (datetime.datetime.strptime(date, "%Y-%m-%d") + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+                    # first trading day of this year, before today
+                    series = self.finance_tool.get_price_series(symbol)
+                    if series is not None:
+                        i = series.index_on_or_after(f"{year}-01-01")
+                        if i is not None and series.date_at(i) < query_date:
+                            stock_info = series.row(i)
                     stock_info_now = self.finance_tool.get_price(symbol, query_date)
                     if stock_info is not None and stock_info_now is not None:
                         info += f"#### Some Information of {company_name} ({symbol})'s Stock Price This Year(Until Now)\n"
@@ -745,7 +780,7 @@ class MockAPI:
                 if date_str != "today" and date_str != "yesterday":
                     note_info += f"- {date_str} of {query_date} is {date}\n"
             if "trading" in query and re.search(r"\bday\b", query) or "last trading" in query:
-                trading_days = self.finance_tool.get_price_history(symbols[0])
+                trading_days = self.finance_tool.get_price_series(symbols[0])
                 if trading_days is not None:
                     if "first trading day of" in query:
                         year = re.findall(r'\d{4}', query)
@@ -764,22 +799,16 @@ class MockAPI:
                                 month_ = match_.group(1)
                                 month = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"].index(month_) + 1
                             date = f"{year}-{month:02d}-01"
-                            trading_days = list(trading_days.keys())
-                            trading_days.sort()
-                            for trading_day in trading_days:
-                                if trading_day[:10] >= date:
-                                    date = trading_day[:10]
-                                    dates = [date]
-                                    break
+                            i = trading_days.index_on_or_after(date)
+                            if i is not None:
+                                date = trading_days.date_at(i)
+                                dates = [date]
                             note_info += f"- First Trading Day of {month_} {year} is {date}\n"
                     else:
-                        trading_days = list(trading_days.keys())
-                        trading_days.sort(reverse=True) 
-                        for trading_day in trading_days:
-                            if trading_day[:10] < query_date:
-                                date = trading_day[:10]
-                                dates = [date]
-                                break
+                        i = trading_days.index_before(query_date)
+                        if i is not None:
+                            date = trading_days.date_at(i)
+                            dates = [date]
                         note_info += f"- Last Trading Day of {query_date} is {date}\n"
             dates.extend(divid_dates)
             for symbol in symbols:
@@ -1024,14 +1053,12 @@ class MockAPI:
                 last_week = get_last_week_dates(query_time)
                 this_week = get_this_week_dates(query_time)
                 last_week_games = {}
-                for d in last_week:
-                    games = self.sports_tool.soccer_get_games_on_date(d, soccer_team)
+                for games in self.sports_tool.soccer_get_games_on_dates(last_week, soccer_team):
                     if games is not None:
                         for k, v in games.items():
                             last_week_games[k] = v
                 this_week_games = {}
-                for d in this_week:
-                    games = self.sports_tool.soccer_get_games_on_date(d, soccer_team)
+                for games in self.sports_tool.soccer_get_games_on_dates(this_week, soccer_team):
                     if games is not None:
                         for k, v in games.items():
                             this_week_games[k] = v
@@ -1053,14 +1080,12 @@ class MockAPI:
                 last_month = get_last_month_dates(query_time)
                 this_month = get_this_month_dates(query_time)
                 last_month_games = {}
-                for d in last_month:
-                    games = self.sports_tool.soccer_get_games_on_date(d, soccer_team)
+                for games in self.sports_tool.soccer_get_games_on_dates(last_month, soccer_team):
                     if games is not None:
                         for k, v in games.items():
                             last_month_games[k] = v
                 this_month_games = {}
-                for d in this_month:
-                    games = self.sports_tool.soccer_get_games_on_date(d, soccer_team)
+                for games in self.sports_tool.soccer_get_games_on_dates(this_month, soccer_team):
                     if games is not None:
                         for k, v in games.items():
                             this_month_games[k] = v
@@ -1211,20 +1236,51 @@ class MockAPI:
 - For Soccer, When ask about win-loss results, possible results are 'Win', 'Loss', 'Draw'."""
         return info
     
+    def get_query_kg_info(self, query, query_time, domain, ner_result):
+        matched_entities = self.name_entity_match(ner_result, domain)
+        if domain == "movie":
+            return self.get_movie_info(query, query_time, matched_entities)
+        elif domain == "music":
+            return self.get_music_info(query, query_time, matched_entities)
+        elif domain == "finance":
+            return self.get_finance_info(query, query_time, matched_entities)
+        elif domain == "sports":
+            return self.get_sports_info(query, query_time, matched_entities)
+        return ""
+
+    def get_partial_kg_info(self, query, query_time, domain, ner_result):
+        """
+        The KG info of a query that did not complete in time: the named entities and the resolved date, no API call.
+        """
+        if domain not in ("movie", "music", "finance", "sports"):
+            return ""
+        info = ""
+        for key, names in ner_result.items():
+            if len(names) > 0:
+                info += f"- {key}: {', '.join(names)}\n"
+        if len(info) > 0:
+            info = "#### Named entities in the question\n" + info
+        date_info = self.get_date_info(query, query_time)
+        if date_info is not None:
+            info += f"- {date_info}\n"
+        return info
+
     def get_kg_info(self, queries, query_times, domains):
-        kg_infos = []
         ner_results = self.ner(queries, domains)
-        for query, query_time, domain, ner_result in zip(queries, query_times, domains, ner_results):
-            matched_entities = self.name_entity_match(ner_result, domain)
-            if domain == "movie":
-                kg_info = self.get_movie_info(query, query_time, matched_entities)
-            elif domain == "music":
-                kg_info = self.get_music_info(query, query_time, matched_entities)
-            elif domain == "finance":
-                kg_info = self.get_finance_info(query, query_time, matched_entities)
-            elif domain == "sports":
-                kg_info = self.get_sports_info(query, query_time, matched_entities)
+        # One pool per batch: threads still stuck in a request after the deadline do not hold up the next batch
+        executor = ThreadPoolExecutor(max_workers=self.kg_num_workers)
+        futures = [executor.submit(self.get_query_kg_info, query, query_time, domain, ner_result) for query, query_time, domain, ner_result in zip(queries, query_times, domains, ner_results)]
+        done, _ = wait(futures, timeout=self.kg_timeout)
+        executor.shutdown(wait=False, cancel_futures=True)
+        kg_infos = []
+        for query, query_time, domain, ner_result, future in zip(queries, query_times, domains, ner_results, futures):
+            if future in done:
+                try:
+                    kg_infos.append(future.result())
+                    continue
+                except Exception as e:
+                    logging.warning(f"KG info of {query!r} failed: {e!r}")
             else:
-                kg_info = ""
-            kg_infos.append(kg_info)
-        return kg_infos
\ No newline at end of file
+                logging.warning(f"KG info of {query!r} not done after {self.kg_timeout}s, using partial info")
+            kg_infos.append(self.get_partial_kg_info(query, query_time, domain, ner_result))
+        return kg_infos
@@ -0,0 +1,219 @@
+import re
+import unicodedata
+from collections import defaultdict
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9]+")
+# Trailing words of the listing names in company_name.dict that nobody types, e.g. "Alphabet Inc. Class A Common Stock" -> "alphabet"
+COMPANY_SUFFIXES = {
+    "common", "stock", "stocks", "ordinary", "share", "shares", "depositary", "depository", "american", "ads", "adr",
+    "class", "a", "b", "c", "de", "inc", "incorporated", "corp", "corporation", "co", "ltd", "limited", "plc", "llc",
+    "lp", "l", "p", "s", "sa", "nv", "n", "v", "ag", "se", "subordinate", "voting", "new", "each", "representing",
+}
+# Extra spellings of the soccer teams, on top of SportsTools.soccer_teams_alter
+SOCCER_ALIASES = {
+    "Manchester Utd": ["Manchester United", "Man Utd", "Man United"],
+    "Manchester City": ["Man City"],
+    "Newcastle Utd": ["Newcastle United", "Newcastle"],
+    "Sheffield Utd": ["Sheffield United"],
+    "Nott'ham Forest": ["Nottingham Forest"],
+    "Paris S-G": ["Paris Saint-Germain", "Paris Saint Germain", "PSG"],
+    "Tottenham": ["Tottenham Hotspur"],
+    "West Ham": ["West Ham United"],
+    "Wolves": ["Wolverhampton", "Wolverhampton Wanderers"],
+    "Brighton": ["Brighton & Hove Albion", "Brighton and Hove Albion"],
+    "Betis": ["Real Betis"],
+    "Atlético Madrid": ["Atletico de Madrid"],
+}
+# Words that are not entities even when they are names in the tries (stock indexes, exchanges, dates...)
+NON_ENTITY_WORDS = {
+    "i", "january", "february", "march", "april", "may", "june", "july", "august", "september", "october", "november",
+    "december", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+    "eps", "pe", "p", "e", "ceo", "cfo", "etf", "ipo", "usd", "us", "nyse", "nasdaq", "ai", "q1", "q2", "q3", "q4",
+    "dow", "jones", "djia", "s", "sp", "spx", "russell", "composite", "industrial", "industrials",
+    "nba", "mvp", "premier", "league", "la", "liga", "ligue", "eng", "esp", "fra",
+}
+# The other words of the questions. Any word that is neither one of them nor matched may be an entity (a player,
+# a company missing from the tries...) and leaves the query to the LLM NER
+QUERY_WORDS = {
+    "a", "about", "above", "after", "again", "against", "ago", "all", "also", "am", "among", "an", "and", "any", "are",
+    "as", "at", "be", "been", "before", "being", "below", "between", "both", "but", "by", "can", "could", "d", "did",
+    "didn", "do", "does", "doesn", "doing", "don", "during", "each", "either", "ever", "every", "few", "for", "from",
+    "had", "has", "have", "having", "he", "her", "here", "him", "his", "how", "if", "in", "into", "is", "isn", "it",
+    "its", "just", "ll", "m", "me", "more", "most", "much", "my", "neither", "no", "nor", "not", "now", "of", "off",
+    "on", "once", "one", "only", "or", "other", "our", "out", "over", "own", "re", "s", "same", "she", "should", "so",
+    "some", "such", "t", "tell", "than", "that", "the", "their", "them", "then", "there", "these", "they", "this",
+    "those", "through", "to", "too", "under", "until", "up", "ve", "very", "was", "wasn", "we", "were", "what", "when",
+    "where", "whether", "which", "while", "who", "whom", "whose", "why", "will", "with", "within", "would", "you",
+    "your", "yet", "get", "got", "give", "know", "many", "number", "amount", "list", "name", "names", "show", "find",
+    "today", "yesterday", "tomorrow", "tonight", "night", "morning", "day", "days", "week", "weeks", "weekend",
+    "month", "months", "year", "years", "time", "times", "date", "dates", "current", "currently", "latest", "last",
+    "past", "previous", "previously", "next", "recent", "recently", "first", "second", "third", "new", "old",
+    "highest", "lowest", "best", "worst", "biggest", "largest", "smallest", "greatest", "least", "fewest", "top",
+    "total", "average", "per", "difference", "different", "compare", "compared", "comparing", "comparison",
+    "versus", "vs", "combined", "together", "since", "far", "long", "consecutive", "straight", "row",
+}
+DOMAIN_WORDS = {
+    "finance": {
+        "stock", "stocks", "share", "shares", "shareholder", "shareholders", "price", "prices", "priced", "open",
+        "opened", "opening", "close", "closed", "closing", "high", "low", "volume", "traded", "trade", "trading",
+        "market", "markets", "cap", "capitalization", "dividend", "dividends", "earnings", "revenue", "revenues",
+        "ratio", "company", "companies", "ticker", "tickers", "symbol", "symbols", "split", "splits", "yield",
+        "return", "returns", "gain", "gained", "gains", "loss", "losses", "lose", "lost", "percent", "percentage",
+        "change", "changed", "rise", "rose", "risen", "fall", "fell", "fallen", "drop", "dropped", "increase",
+        "increased", "decrease", "decreased", "value", "worth", "valued", "valuation", "index", "indexes", "indices",
+        "exchange", "listed", "sector", "industry", "annual", "annually", "quarter", "quarterly", "fiscal", "payout",
+        "pay", "paid", "pays", "distributed", "ex", "record", "performance", "perform", "performed", "beta",
+        "outstanding", "float", "interest", "growth", "grew", "net", "income", "profit", "profits", "margin", "debt",
+        "cash", "flow", "book", "analyst", "analysts", "rating", "estimate", "estimates", "buy", "sell", "bought",
+        "sold", "invest", "investors", "investment", "fund", "funds", "equity", "assets", "dollar", "dollars",
+        "million", "billion", "trillion", "points", "point", "moving", "session", "sessions", "intraday", "hit",
+        "reach", "reached", "go", "went", "make", "made", "earn", "earned", "report", "reported", "announce",
+        "announced", "release", "released", "public", "target", "targets", "peak", "peaked",
+    },
+    "sports": {
+        "score", "scored", "scores", "scoring", "scorer", "scorers", "point", "points", "goal", "goals", "assist",
+        "assists", "rebound", "rebounds", "steal", "steals", "block", "blocks", "turnover", "turnovers", "foul",
+        "fouls", "minute", "minutes", "win", "wins", "won", "winning", "winner", "winners", "lose", "loses", "lost",
+        "losing", "loss", "losses", "beat", "beats", "beaten", "defeat", "defeated", "play", "plays", "played",
+        "playing", "player", "players", "team", "teams", "club", "clubs", "coach", "coached", "manager", "match",
+        "matches", "game", "games", "season", "seasons", "playoff", "playoffs", "final", "finals", "championship",
+        "championships", "champion", "champions", "title", "titles", "cup", "home", "away", "record", "records",
+        "standing", "standings", "table", "rank", "ranked", "ranking", "position", "place", "draw", "draws", "drew",
+        "tie", "tied", "ties", "lead", "led", "leading", "leader", "leaders", "three", "pointer", "pointers", "field",
+        "free", "throw", "throws", "percentage", "averaged", "averages", "double", "triple", "doubles", "triples",
+        "shot", "shots", "attempt", "attempts", "made", "clean", "sheet", "sheets", "yellow", "red", "card", "cards",
+        "penalty", "penalties", "kick", "stadium", "arena", "attendance", "conference", "east", "eastern", "west",
+        "western", "division", "stats", "statistics", "stat", "career", "history", "star", "draft", "drafted",
+        "pick", "rookie", "opponent", "opponents", "half", "halftime", "quarter", "overtime", "margin", "schedule",
+        "scheduled", "upcoming", "soccer", "football", "basketball", "sport", "sports", "fixture", "fixtures",
+        "result", "results", "face", "faced", "host", "hosted", "visit", "visited", "go", "went", "make", "take",
+        "took", "end", "ended", "finish", "finished", "start", "started", "starting", "appearance", "appearances",
+        "bench", "roster", "starter", "starters", "keep", "kept",
+    },
+}
+# Words of the questions comparing entities, with a single entity found the other ones were missed
+COMPARISON_PATTERN = re.compile(r"\b(or|vs|versus|than|compared?|comparing|comparison|both)\b", re.IGNORECASE)
+NER_KEYS = {
+    "finance": ["company", "symbol"],
+    "sports": ["nba team", "soccer team", "nba player", "soccer player"],
+}
+
+
+def strip_accents(text):
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(strip_accents(text))
+
+
+def normalize_company_name(name):
+    """
+    The lowercased tokens of a company name without its legal and share class suffixes.
+    """
+    tokens = [token.lower() for token in tokenize(re.sub(r"\(.*?\)", " ", name))]
+    while len(tokens) > 1 and tokens[-1] in COMPANY_SUFFIXES:
+        tokens.pop()
+    if len(tokens) > 1 and tokens[0] == "the":
+        tokens.pop(0)
+    return tokens
+
+
+class Gazetteer:
+    """
+    Rule-based NER of the closed vocabulary domains: NBA and soccer teams (with their aliases), companies and
+    ticker symbols. Names are matched longest first on a word-level trie built once. `match` returns the same
+    results as MockAPI.ner_output_parser, or None if the LLM NER is still needed.
+    """
+    def __init__(self, finance_tool, sports_tool):
+        self.symbols = set(finance_tool.all_symbols)
+        self.tries = {"finance": {}, "sports": {}}
+        self.words = {domain: QUERY_WORDS | NON_ENTITY_WORDS | words for domain, words in DOMAIN_WORDS.items()}
+        # 3 letter team codes (e.g. GSW) are only matched as upper case tokens, like ticker symbols
+        self.codes = {}
+
+        for team in sports_tool.nba_teams:
+            self.add("sports", team, "nba team", team)
+            for alias in sports_tool.nba_teams_alter[team]:
+                if len(alias) == 3 and alias.isupper():
+                    self.codes[alias] = team
+                else:
+                    self.add("sports", alias, "nba team", team)
+        for team in sports_tool.soccer_teams:
+            self.add("sports", team, "soccer team", team)
+            for alias in sports_tool.soccer_teams_alter[team] + SOCCER_ALIASES.get(team, []):
+                self.add("sports", alias, "soccer team", team)
+
+        # When several listings share a name (common stock, warrants, units...), keep the shortest ticker
+        companies = {}
+        for name, symbol in finance_tool.name2symbol.items():
+            tokens = tuple(normalize_company_name(name))
+            if len(tokens) == 0 or len("".join(tokens)) < 3:
+                continue
+            if tokens not in companies or len(symbol) < len(companies[tokens][1]):
+                companies[tokens] = (name, symbol)
+        for tokens, (name, symbol) in companies.items():
+            self.add_tokens("finance", list(tokens), "company", name)
+
+    def add(self, domain, name, category, value):
+        self.add_tokens(domain, [token.lower() for token in tokenize(name)], category, value)
+
+    def add_tokens(self, domain, tokens, category, value):
+        if len(tokens) == 0:
+            return
+        node = self.tries[domain]
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node.setdefault(None, (category, value, len(tokens)))
+
+    def longest_match(self, trie, tokens, start):
+        node, match = trie, None
+        for i in range(start, len(tokens)):
+            node = node.get(tokens[i].lower())
+            if node is None:
+                break
+            if None in node:
+                match = node[None]
+        return match
+
+    def is_query_word(self, token, domain):
+        token = token.lower()
+        return token in self.words[domain] or any(c.isdigit() for c in token)
+
+    def match(self, query, domain):
+        if domain not in self.tries:
+            return None
+        tokens = tokenize(query)
+        results = defaultdict(list)
+        residual = False
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            if domain == "finance" and token.isupper() and len(token) > 1 and token in self.symbols and token.lower() not in NON_ENTITY_WORDS:
+                category, value, length = "symbol", token, 1
+            elif domain == "sports" and token in self.codes:
+                category, value, length = "nba team", self.codes[token], 1
+            else:
+                category, value, length = self.longest_match(self.tries[domain], tokens, i) or (None, None, 1)
+                if category is not None and all(t.lower() in NON_ENTITY_WORDS for t in tokens[i:i + length]):
+                    # "nasdaq" or "dow" are the index or the exchange, not Nasdaq Inc. or Dow Inc.
+                    category, value, length = None, None, 1
+                elif category == "company" and length == 1 and self.is_query_word(token, domain):
+                    # A single word company name that is also a common word ("target", "block") may or may not be
+                    # the company: the query is left to the LLM
+                    category = None
+            if category is None:
+                # Whatever its case, an unknown word may be a player or a company we miss
+                if not self.is_query_word(token, domain) and token.lower() not in NON_ENTITY_WORDS:
+                    residual = True
+            elif value not in results[category]:
+                results[category].append(value)
+            i += length
+
+        if residual or len(results) == 0:
+            return None
+        if sum(len(values) for values in results.values()) == 1 and COMPARISON_PATTERN.search(query) is not None:
+            return None
+        for key in NER_KEYS[domain]:
+            results[key] = list(results[key])
+        return results
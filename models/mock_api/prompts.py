@@ -69,6 +69,9 @@ every entity should be in a new line and be in the format of "entity_name (entit
 
 """
 
+# Part of the key of the NER cache, bump it when a NER_*_SYSTEM_PROMPT / NER_*_USER_PROMPT changes
+NER_PROMPT_VERSION = 1
+
 NER_OPEN_SYSTEM_PROMPT = """please identify and list all the named entities present in the following question instead answering it, categorizing them appropriately (e.g., person, location, orgnization, product, event and so on)Your answer should be short and concise in 50 words.
 Format your response as follows: For each entity, provide the name followed by its category in parentheses.  Categories include person, location, orgnization, product, event and so on. Ensure that your response is clearly structured and easy to read."""
 
@@ -4,11 +4,41 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
+import asyncio
 import json
 import os
+import threading
 from typing import List
 
+import aiohttp
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from models.cache import LRUCache
+
+# Time-to-live (seconds) of cached responses per endpoint, endpoints not listed never expire
+CACHE_TTL = {
+    '/finance/get_detailed_price_history': 60,
+    '/finance/get_price_history': 3600,
+    '/finance/get_dividends_history': 3600,
+    '/finance/get_market_capitalization': 3600,
+    '/finance/get_eps': 3600,
+    '/finance/get_pe_ratio': 3600,
+    '/finance/get_info': 3600,
+    '/sports/soccer/get_games_on_date': 3600,
+    '/sports/nba/get_games_on_date': 3600,
+}
+
+
+def get_cache_key(path:str, data:dict=None):
+    return path + json.dumps(data, sort_keys=True)
+
+
+def project_movies(movies, fields=None):
+    if fields is None:
+        return movies
+    return [None if movie is None else {field: movie.get(field) for field in fields} for movie in movies]
 
 
 class CRAG(object):
@@ -17,6 +47,9 @@ class CRAG(object):
 
     Attributes:
         server (str): The base URL of the CRAG server. Defaults to "http://127.0.0.1:8000".
+        session (requests.Session): A keep-alive session with a connection pool, shared by all the requests of the client.
+        timeout (tuple): (connect timeout, read timeout) of each request in seconds.
+        cache (LRUCache): Cache of the responses (None to disable), entries expire according to `CACHE_TTL`.
 
     Methods:
         open_search_entity_by_name(query: str) -> dict: Search for entities by name in the Open domain.
@@ -26,6 +59,7 @@ class CRAG(object):
         movie_get_year_info(year: str) -> dict: Get information about movies released in a specific year.
         movie_get_movie_info_by_id(movie_id: int) -> dict: Get movie information by its unique ID.
         movie_get_person_info_by_id(person_id: int) -> dict: Get person information by their unique ID.
+        movie_get_movie_info_by_ids(movie_ids: List[int], fields: List[str] = None) -> dict: Get the information (or only `fields`) of several movies in one request.
         finance_get_company_name(query: str) -> dict: Search for company names in the finance domain.
         finance_get_ticker_by_name(query: str) -> dict: Retrieve the ticker symbol for a given company name.
         finance_get_price_history(ticker_name: str) -> dict: Get the price history for a given ticker symbol.
@@ -60,273 +94,427 @@ class CRAG(object):
 
     Note:
         Each method performs a POST request to the corresponding API endpoint and returns the response as a JSON dictionary.
+        A single client can be shared by all the tools; connections are reused across calls and threads.
     """    
-    def __init__(self):
-        self.server = os.getenv("CRAG_MOCK_API_URL", "http://localhost:8000")
+    def __init__(self, server=None, pool_size=32, timeout=(5, 60), max_retries=3, backoff_factor=0.5, cache=None, use_cache=True):
+        self.server = server or os.getenv("CRAG_MOCK_API_URL", "http://localhost:8000")
+        self.timeout = timeout
+        self.cache = cache if cache is not None or not use_cache else LRUCache(maxsize=1024)
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        # Set to False once the server answers that it has no bulk movie endpoint
+        self.bulk_movies = True
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["POST"],
+            # After the last retry the response is returned, as without retries, instead of raising RetryError
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({'accept': "application/json"})
+
+    def _post(self, path:str, data:dict=None):
+        return json.loads(self._fetch(path, data)[1])
+
+    def _fetch(self, path:str, data:dict=None):
+        """
+        The status code and body of the response, 200 responses are cached.
+        """
+        if self.cache is None:
+            return self._request(path, data)
+        key = get_cache_key(path, data)
+        text = self.cache.get(key)
+        if text is not None:
+            return 200, text
+        # Only one thread requests a given key at a time, the others wait for its response to be cached
+        with self._inflight_lock:
+            event = self._inflight.get(key)
+            owner = event is None
+            if owner:
+                event = self._inflight[key] = threading.Event()
+        if not owner:
+            event.wait()
+            text = self.cache.get(key)
+            if text is not None:
+                return 200, text
+            return self._request(path, data)
+        try:
+            status_code, text = self._request(path, data)
+            if status_code == 200:
+                self.cache.set(key, text, ttl=CACHE_TTL.get(path))
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+            event.set()
+        return status_code, text
+
+    def _request(self, path:str, data:dict=None):
+        result = self.session.post(self.server + path, json=data, timeout=self.timeout)
+        return result.status_code, result.text
+
+    def close(self):
+        self.session.close()
     
     def open_search_entity_by_name(self, query:str):
-        url = self.server + '/open/search_entity_by_name'
-        headers={'accept': "application/json"}
-        data = {'query': query}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/open/search_entity_by_name', {'query': query})
 
     def open_get_entity(self, entity:str):
-        url = self.server + '/open/get_entity'
-        headers={'accept': "application/json"}
-        data = {'query': entity}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/open/get_entity', {'query': entity})
 
     def movie_get_person_info(self, person_name:str):
-        url = self.server + '/movie/get_person_info'
-        headers={'accept': "application/json"}
-        data = {'query': person_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/movie/get_person_info', {'query': person_name})
 
     def movie_get_movie_info(self, movie_name:str):
-        url = self.server + '/movie/get_movie_info'
-        headers={'accept': "application/json"}
-        data = {'query': movie_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/movie/get_movie_info', {'query': movie_name})
 
     def movie_get_year_info(self, year:str):
-        url = self.server + '/movie/get_year_info'
-        headers={'accept': "application/json"}
-        data = {'query': year}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/movie/get_year_info', {'query': year})
 
     def movie_get_movie_info_by_id(self, movid_id:int):
-        url = self.server + '/movie/get_movie_info_by_id'
-        headers={'accept': "application/json"}
-        data = {'query': movid_id}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/movie/get_movie_info_by_id', {'query': movid_id})
 
     def movie_get_person_info_by_id(self, person_id:int):
-        url = self.server + '/movie/get_person_info_by_id'
-        headers={'accept': "application/json"}
-        data = {'query': person_id}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/movie/get_person_info_by_id', {'query': person_id})
+
+    def movie_get_movie_info_by_ids(self, movie_ids:List[int], fields:List[str]=None):
+        # Servers without the bulk endpoint (404/405) are sent one movie_get_movie_info_by_id request per movie from
+        # then on, other errors (e.g. a transient 500) only fall back for this call
+        if self.bulk_movies:
+            status_code, text = self._fetch('/movie/get_movie_info_by_ids', {'query': list(movie_ids), 'fields': fields})
+            if status_code == 200:
+                return json.loads(text)
+            if status_code in (404, 405):
+                self.bulk_movies = False
+        return {'result': project_movies([self.movie_get_movie_info_by_id(movie_id)['result'] for movie_id in movie_ids], fields)}
     
     def finance_get_company_name(self, query:str):
-        url = self.server + '/finance/get_company_name'
-        headers={'accept': "application/json"}
-        data = {'query': query}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/finance/get_company_name', {'query': query})
 
     def finance_get_ticker_by_name(self, query:str):
-        url = self.server + '/finance/get_ticker_by_name'
-        headers={'accept': "application/json"}
-        data = {'query': query}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/finance/get_ticker_by_name', {'query': query})
 
     def finance_get_price_history(self, ticker_name:str):
-        url = self.server + '/finance/get_price_history'
-        headers={'accept': "application/json"}
-        data = {'query': ticker_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/finance/get_price_history', {'query': ticker_name})
 
     def finance_get_detailed_price_history(self, ticker_name:str):
-        url = self.server + '/finance/get_detailed_price_history'
-        headers={'accept': "application/json"}
-        data = {'query': ticker_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/finance/get_detailed_price_history', {'query': ticker_name})
 
     def finance_get_dividends_history(self, ticker_name:str):
-        url = self.server + '/finance/get_dividends_history'
-        headers={'accept': "application/json"}
-        data = {'query': ticker_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/finance/get_dividends_history', {'query': ticker_name})
     
     def finance_get_market_capitalization(self, ticker_name:str):
-        url = self.server + '/finance/get_market_capitalization'
-        headers={'accept': "application/json"}
-        data = {'query': ticker_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/finance/get_market_capitalization', {'query': ticker_name})
 
     def finance_get_eps(self, ticker_name:str):
-        url = self.server + '/finance/get_eps'
-        headers={'accept': "application/json"}
-        data = {'query': ticker_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/finance/get_eps', {'query': ticker_name})
 
     def finance_get_pe_ratio(self, ticker_name:str):
-        url = self.server + '/finance/get_pe_ratio'
-        headers={'accept': "application/json"}
-        data = {'query': ticker_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/finance/get_pe_ratio', {'query': ticker_name})
 
     def finance_get_info(self, ticker_name:str):
-        url = self.server + '/finance/get_info'
-        headers={'accept': "application/json"}
-        data = {'query': ticker_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/finance/get_info', {'query': ticker_name})
 
     def music_search_artist_entity_by_name(self, artist_name:str):
-        url = self.server + '/music/search_artist_entity_by_name'
-        headers={'accept': "application/json"}
-        data = {'query': artist_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/music/search_artist_entity_by_name', {'query': artist_name})
 
     def music_search_song_entity_by_name(self, song_name:str):
-        url = self.server + '/music/search_song_entity_by_name'
-        headers={'accept': "application/json"}
-        data = {'query': song_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/music/search_song_entity_by_name', {'query': song_name})
 
     def music_get_billboard_rank_date(self, rank:int, date:str=None):
-        url = self.server + '/music/get_billboard_rank_date'
-        headers={'accept': "application/json"}
-        data = {'rank': rank, 'date': date}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/music/get_billboard_rank_date', {'rank': rank, 'date': date})
 
     def music_get_billboard_attributes(self, date:str, attribute:str, song_name:str):
-        url = self.server + '/music/get_billboard_attributes'
-        headers={'accept': "application/json"}
-        data = {'date': date, 'attribute': attribute, 'song_name': song_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/music/get_billboard_attributes', {'date': date, 'attribute': attribute, 'song_name': song_name})
 
     def music_grammy_get_best_artist_by_year(self, year:int):
-        url = self.server + '/music/grammy_get_best_artist_by_year'
-        headers={'accept': "application/json"}
-        data = {'query': year}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/music/grammy_get_best_artist_by_year', {'query': year})
 
     def music_grammy_get_award_count_by_artist(self, artist_name:str):
-        url = self.server + '/music/grammy_get_award_count_by_artist'
-        headers={'accept': "application/json"}
-        data = {'query': artist_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/music/grammy_get_award_count_by_artist', {'query': artist_name})
 
     def music_grammy_get_award_count_by_song(self, song_name:str):
-        url = self.server + '/music/grammy_get_award_count_by_song'
-        headers={'accept': "application/json"}
-        data = {'query': song_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/music/grammy_get_award_count_by_song', {'query': song_name})
 
     def music_grammy_get_best_song_by_year(self, year:int):
-        url = self.server + '/music/grammy_get_best_song_by_year'
-        headers={'accept': "application/json"}
-        data = {'query': year}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/music/grammy_get_best_song_by_year', {'query': year})
 
     def music_grammy_get_award_date_by_artist(self, artist_name:str):
-        url = self.server + '/music/grammy_get_award_date_by_artist'
-        headers={'accept': "application/json"}
-        data = {'query': artist_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/music/grammy_get_award_date_by_artist', {'query': artist_name})
 
     def music_grammy_get_best_album_by_year(self, year:int):
-        url = self.server + '/music/grammy_get_best_album_by_year'
-        headers={'accept': "application/json"}
-        data = {'query': year}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/music/grammy_get_best_album_by_year', {'query': year})
 
     def music_grammy_get_all_awarded_artists(self):
-        url = self.server + '/music/grammy_get_all_awarded_artists'
-        headers={'accept': "application/json"}
-        result = requests.post(url, headers=headers)
-        return json.loads(result.text)
+        return self._post('/music/grammy_get_all_awarded_artists')
 
     def music_get_artist_birth_place(self, artist_name:str):
-        url = self.server + '/music/get_artist_birth_place'
-        headers={'accept': "application/json"}
-        data = {'query': artist_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/music/get_artist_birth_place', {'query': artist_name})
 
     def music_get_artist_birth_date(self, artist_name:str):
-        url = self.server + '/music/get_artist_birth_date'
-        headers={'accept': "application/json"}
-        data = {'query': artist_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/music/get_artist_birth_date', {'query': artist_name})
 
     def music_get_members(self, band_name:str):
-        url = self.server + '/music/get_members'
-        headers={'accept': "application/json"}
-        data = {'query': band_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/music/get_members', {'query': band_name})
 
     def music_get_lifespan(self, artist_name:str):
-        url = self.server + '/music/get_lifespan'
-        headers={'accept': "application/json"}
-        data = {'query': artist_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/music/get_lifespan', {'query': artist_name})
 
     def music_get_song_author(self, song_name:str):
-        url = self.server + '/music/get_song_author'
-        headers={'accept': "application/json"}
-        data = {'query': song_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/music/get_song_author', {'query': song_name})
 
     def music_get_song_release_country(self, song_name:str):
-        url = self.server + '/music/get_song_release_country'
-        headers={'accept': "application/json"}
-        data = {'query': song_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/music/get_song_release_country', {'query': song_name})
 
     def music_get_song_release_date(self, song_name:str):
-        url = self.server + '/music/get_song_release_date'
-        headers={'accept': "application/json"}
-        data = {'query': song_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/music/get_song_release_date', {'query': song_name})
 
     def music_get_artist_all_works(self, song_name:str):
-        url = self.server + '/music/get_artist_all_works'
-        headers={'accept': "application/json"}
-        data = {'query': song_name}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/music/get_artist_all_works', {'query': song_name})
 
     def sports_soccer_get_games_on_date(self, date:str, team_name:str=None):
-        url = self.server + '/sports/soccer/get_games_on_date'
-        headers={'accept': "application/json"}
-        data = {'team_name': team_name, 'date': date}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/sports/soccer/get_games_on_date', {'team_name': team_name, 'date': date})
 
     def sports_nba_get_games_on_date(self, date:str, team_name:str=None):
-        url = self.server + '/sports/nba/get_games_on_date'
-        headers={'accept': "application/json"}
-        data = {'team_name': team_name, 'date': date}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/sports/nba/get_games_on_date', {'team_name': team_name, 'date': date})
 
     def sports_nba_get_play_by_play_data_by_game_ids(self, game_ids:List[str]):
-        url = self.server + '/sports/nba/get_play_by_play_data_by_game_ids'
-        headers={'accept': "application/json"}
-        data = {'game_ids': game_ids}
-        result = requests.post(url, json=data, headers=headers)
-        return json.loads(result.text)
+        return self._post('/sports/nba/get_play_by_play_data_by_game_ids', {'game_ids': game_ids})
 
+
+class AsyncCRAG(object):
+    """
+    An asyncio client for the CRAG server, with the same endpoint methods as `CRAG` (as coroutines).
+
+    The client owns an event loop running in a background thread, with a single aiohttp session, so it can be shared by the tools
+    and used from synchronous code through `run` and `map`. At most `max_concurrency` requests are in flight at the same time.
+
+    Example:
+        api = AsyncCRAG()
+        movies = api.map(api.movie_get_movie_info_by_id, movie_ids)
+    """
+    def __init__(self, server=None, max_concurrency=16, timeout=60, cache=None, use_cache=True):
+        self.server = server or os.getenv("CRAG_MOCK_API_URL", "http://localhost:8000")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.cache = cache if cache is not None or not use_cache else LRUCache(maxsize=1024)
+        self._inflight = {}
+        self.bulk_movies = True
+        self._loop = None
+        self._session = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+
+    def _get_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, daemon=True).start()
+                asyncio.run_coroutine_threadsafe(self._open(), loop).result()
+                self._loop = loop
+        return self._loop
+
+    async def _open(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={'accept': "application/json"},
+        )
+
+    async def _post(self, path:str, data:dict=None):
+        return json.loads((await self._fetch(path, data))[1])
+
+    async def _fetch(self, path:str, data:dict=None):
+        """
+        The status code and body of the response, 200 responses are cached.
+        """
+        if self.cache is None:
+            return await self._request(path, data)
+        key = get_cache_key(path, data)
+        text = self.cache.get(key)
+        if text is not None:
+            return 200, text
+        # Concurrent requests of the same key share one round-trip (all coroutines run on the client loop)
+        future = self._inflight.get(key)
+        if future is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The request owning the round-trip was cancelled, not this one: send it again
+                if not future.cancelled():
+                    raise
+            return await self._fetch(path, data)
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            status_code, text = await self._request(path, data)
+            if status_code == 200:
+                self.cache.set(key, text, ttl=CACHE_TTL.get(path))
+            future.set_result((status_code, text))
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieved here, so that it is not logged as never retrieved when nobody waits for it
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+        return status_code, text
+
+    async def _request(self, path:str, data:dict=None):
+        async with self._semaphore:
+            async with self._session.post(self.server + path, json=data) as result:
+                return result.status, await result.text()
+
+    def run(self, coro):
+        """
+        Run a coroutine on the event loop of the client and wait for its result. Must not be called from a coroutine of the client.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop()).result()
+
+    def map(self, fn, items):
+        """
+        Run `fn(item)` concurrently for all the items and return the results in the order of the items.
+        """
+        async def gather():
+            return await asyncio.gather(*[fn(item) for item in items])
+        if len(items) == 0:
+            return []
+        return self.run(gather())
+
+    def close(self):
+        with self._lock:
+            if self._loop is not None:
+                asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result()
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop = None
+
+    async def open_search_entity_by_name(self, query:str):
+        return await self._post('/open/search_entity_by_name', {'query': query})
+
+    async def open_get_entity(self, entity:str):
+        return await self._post('/open/get_entity', {'query': entity})
+
+    async def movie_get_person_info(self, person_name:str):
+        return await self._post('/movie/get_person_info', {'query': person_name})
+
+    async def movie_get_movie_info(self, movie_name:str):
+        return await self._post('/movie/get_movie_info', {'query': movie_name})
+
+    async def movie_get_year_info(self, year:str):
+        return await self._post('/movie/get_year_info', {'query': year})
+
+    async def movie_get_movie_info_by_id(self, movid_id:int):
+        return await self._post('/movie/get_movie_info_by_id', {'query': movid_id})
+
+    async def movie_get_person_info_by_id(self, person_id:int):
+        return await self._post('/movie/get_person_info_by_id', {'query': person_id})
+
+    async def movie_get_movie_info_by_ids(self, movie_ids:List[int], fields:List[str]=None):
+        if self.bulk_movies:
+            status_code, text = await self._fetch('/movie/get_movie_info_by_ids', {'query': list(movie_ids), 'fields': fields})
+            if status_code == 200:
+                return json.loads(text)
+            if status_code in (404, 405):
+                self.bulk_movies = False
+        responses = await asyncio.gather(*[self.movie_get_movie_info_by_id(movie_id) for movie_id in movie_ids])
+        return {'result': project_movies([response['result'] for response in responses], fields)}
     
+    async def finance_get_company_name(self, query:str):
+        return await self._post('/finance/get_company_name', {'query': query})
+
+    async def finance_get_ticker_by_name(self, query:str):
+        return await self._post('/finance/get_ticker_by_name', {'query': query})
+
+    async def finance_get_price_history(self, ticker_name:str):
+        return await self._post('/finance/get_price_history', {'query': ticker_name})
+
+    async def finance_get_detailed_price_history(self, ticker_name:str):
+        return await self._post('/finance/get_detailed_price_history', {'query': ticker_name})
+
+    async def finance_get_dividends_history(self, ticker_name:str):
+        return await self._post('/finance/get_dividends_history', {'query': ticker_name})
+    
+    async def finance_get_market_capitalization(self, ticker_name:str):
+        return await self._post('/finance/get_market_capitalization', {'query': ticker_name})
+
+    async def finance_get_eps(self, ticker_name:str):
+        return await self._post('/finance/get_eps', {'query': ticker_name})
+
+    async def finance_get_pe_ratio(self, ticker_name:str):
+        return await self._post('/finance/get_pe_ratio', {'query': ticker_name})
+
+    async def finance_get_info(self, ticker_name:str):
+        return await self._post('/finance/get_info', {'query': ticker_name})
+
+    async def music_search_artist_entity_by_name(self, artist_name:str):
+        return await self._post('/music/search_artist_entity_by_name', {'query': artist_name})
+
+    async def music_search_song_entity_by_name(self, song_name:str):
+        return await self._post('/music/search_song_entity_by_name', {'query': song_name})
+
+    async def music_get_billboard_rank_date(self, rank:int, date:str=None):
+        return await self._post('/music/get_billboard_rank_date', {'rank': rank, 'date': date})
+
+    async def music_get_billboard_attributes(self, date:str, attribute:str, song_name:str):
+        return await self._post('/music/get_billboard_attributes', {'date': date, 'attribute': attribute, 'song_name': song_name})
+
+    async def music_grammy_get_best_artist_by_year(self, year:int):
+        return await self._post('/music/grammy_get_best_artist_by_year', {'query': year})
+
+    async def music_grammy_get_award_count_by_artist(self, artist_name:str):
+        return await self._post('/music/grammy_get_award_count_by_artist', {'query': artist_name})
+
+    async def music_grammy_get_award_count_by_song(self, song_name:str):
+        return await self._post('/music/grammy_get_award_count_by_song', {'query': song_name})
+
+    async def music_grammy_get_best_song_by_year(self, year:int):
+        return await self._post('/music/grammy_get_best_song_by_year', {'query': year})
+
+    async def music_grammy_get_award_date_by_artist(self, artist_name:str):
+        return await self._post('/music/grammy_get_award_date_by_artist', {'query': artist_name})
+
+    async def music_grammy_get_best_album_by_year(self, year:int):
+        return await self._post('/music/grammy_get_best_album_by_year', {'query': year})
+
+    async def music_grammy_get_all_awarded_artists(self):
+        return await self._post('/music/grammy_get_all_awarded_artists')
+
+    async def music_get_artist_birth_place(self, artist_name:str):
+        return await self._post('/music/get_artist_birth_place', {'query': artist_name})
+
+    async def music_get_artist_birth_date(self, artist_name:str):
+        return await self._post('/music/get_artist_birth_date', {'query': artist_name})
+
+    async def music_get_members(self, band_name:str):
+        return await self._post('/music/get_members', {'query': band_name})
+
+    async def music_get_lifespan(self, artist_name:str):
+        return await self._post('/music/get_lifespan', {'query': artist_name})
+
+    async def music_get_song_author(self, song_name:str):
+        return await self._post('/music/get_song_author', {'query': song_name})
+
+    async def music_get_song_release_country(self, song_name:str):
+        return await self._post('/music/get_song_release_country', {'query': song_name})
+
+    async def music_get_song_release_date(self, song_name:str):
+        return await self._post('/music/get_song_release_date', {'query': song_name})
+
+    async def music_get_artist_all_works(self, song_name:str):
+        return await self._post('/music/get_artist_all_works', {'query': song_name})
+
+    async def sports_soccer_get_games_on_date(self, date:str, team_name:str=None):
+        return await self._post('/sports/soccer/get_games_on_date', {'team_name': team_name, 'date': date})
+
+    async def sports_nba_get_games_on_date(self, date:str, team_name:str=None):
+        return await self._post('/sports/nba/get_games_on_date', {'team_name': team_name, 'date': date})
+
+    async def sports_nba_get_play_by_play_data_by_game_ids(self, game_ids:List[str]):
+        return await self._post('/sports/nba/get_play_by_play_data_by_game_ids', {'game_ids': game_ids})
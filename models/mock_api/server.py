@@ -0,0 +1,100 @@
+# A local stand-in for the CRAG mock API server, in front of the official one (the upstream). It adds the bulk
+# endpoint /movie/get_movie_info_by_ids and proxies every other request to the upstream unchanged.
+# Run from the root of the repository:
+#   python -m models.mock_api.server --upstream http://localhost:8000 --port 8001
+# and point the clients to it with CRAG_MOCK_API_URL=http://localhost:8001
+import asyncio
+import logging
+import argparse
+import aiohttp
+from aiohttp import web
+from models.cache import LRUCache
+from models.mock_api.pycragapi import project_movies
+
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "content-length", "content-encoding", "host"}
+
+
+class MockAPIServer:
+    """
+    Args:
+        upstream: base URL of the CRAG mock API server
+        max_concurrency: requests in flight to the upstream at the same time
+        cache_size: movies kept in memory by the bulk endpoint
+    """
+    def __init__(self, upstream, max_concurrency=32, cache_size=100000, timeout=60):
+        self.upstream = upstream.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.movies = LRUCache(maxsize=cache_size)
+        self.session = None
+        self.semaphore = None
+
+    async def on_startup(self, app):
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    async def on_cleanup(self, app):
+        await self.session.close()
+
+    async def get_movie(self, movie_id):
+        """
+        The movie, or None if it is unknown or its request failed (the bulk request still succeeds).
+        """
+        movie = self.movies.get(movie_id)
+        if movie is not None:
+            return movie
+        try:
+            async with self.semaphore:
+                async with self.session.post(f"{self.upstream}/movie/get_movie_info_by_id", json={"query": movie_id}) as response:
+                    if response.status != 200:
+                        return None
+                    movie = (await response.json()).get("result")
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logging.warning(f"Movie {movie_id}: {e!r}")
+            return None
+        if movie is not None:
+            self.movies.set(movie_id, movie)
+        return movie
+
+    async def get_movie_info_by_ids(self, request):
+        """
+        {"query": [movie_id, ...], "fields": ["title", "original_title"] or null} -> {"result": [movie or null, ...]}
+        """
+        data = await request.json()
+        movie_ids = list(data.get("query") or [])
+        unique_ids = list(dict.fromkeys(movie_ids))
+        movies = dict(zip(unique_ids, await asyncio.gather(*[self.get_movie(movie_id) for movie_id in unique_ids])))
+        return web.json_response({"result": project_movies([movies[movie_id] for movie_id in movie_ids], data.get("fields"))})
+
+    async def proxy(self, request):
+        headers = {key: value for key, value in request.headers.items() if key.lower() not in HOP_BY_HOP_HEADERS}
+        async with self.semaphore:
+            async with self.session.request(request.method, self.upstream + request.path_qs, headers=headers, data=await request.read()) as response:
+                body = await response.read()
+                headers = {key: value for key, value in response.headers.items() if key.lower() not in HOP_BY_HOP_HEADERS}
+                return web.Response(status=response.status, body=body, headers=headers)
+
+    def make_app(self):
+        app = web.Application(client_max_size=64 * 1024 ** 2)
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        app.router.add_post("/movie/get_movie_info_by_ids", self.get_movie_info_by_ids)
+        app.router.add_route("*", "/{path:.*}", self.proxy)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CRAG mock API with a bulk movie endpoint, proxying the upstream server")
+    parser.add_argument("--upstream", default="http://localhost:8000")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--max-concurrency", type=int, default=32)
+    args = parser.parse_args()
+    web.run_app(MockAPIServer(args.upstream, args.max_concurrency).make_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import numpy as np
+from models.mock_api.gazetteer import normalize_company_name
+
+
+def get_trigrams(text):
+    text = f"  {text} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class CompanyIndex:
+    """
+    In-process fuzzy search of company names, the local counterpart of the finance_get_company_name API.
+    Names are indexed by the character trigrams of their normalized form (lowercased, without suffixes such as
+    "Inc. Common Stock" or "Class A"), in an inverted index stored as NumPy arrays (CSR). A search counts the shared
+    trigrams of every name with one bincount over the postings of the query trigrams and ranks by Jaccard similarity.
+
+    Args:
+        names: the company names, e.g. "Apple Inc. Common Stock"
+        symbols: their ticker symbols, the shortest one wins among names that normalize to the same string
+    """
+    def __init__(self, names, symbols):
+        self.names = list(names)
+        self.symbols = list(symbols)
+        vocabulary = {}
+        name_ids, trigram_ids, sizes = [], [], []
+        for i, name in enumerate(self.names):
+            trigrams = get_trigrams(" ".join(normalize_company_name(name)) or name.lower())
+            for trigram in trigrams:
+                trigram_ids.append(vocabulary.setdefault(trigram, len(vocabulary)))
+                name_ids.append(i)
+            sizes.append(len(trigrams))
+        self.vocabulary = vocabulary
+        trigram_ids = np.array(trigram_ids, dtype=np.int64)
+        order = np.argsort(trigram_ids, kind="stable")
+        self.postings = np.array(name_ids, dtype=np.int32)[order]
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(trigram_ids, minlength=len(vocabulary)))])
+        self.sizes = np.array(sizes, dtype=np.float32)
+        self.symbol_lengths = np.array([len(symbol) for symbol in self.symbols], dtype=np.int32)
+
+    @classmethod
+    def from_symbol2name(cls, symbol2name):
+        return cls(symbol2name.values(), symbol2name.keys())
+
+    def search(self, query, top_k=10):
+        """
+        The top_k (name, score) pairs, by decreasing Jaccard similarity of the trigram sets.
+        """
+        trigrams = get_trigrams(" ".join(normalize_company_name(query)) or query.lower())
+        ids = [self.vocabulary[trigram] for trigram in trigrams if trigram in self.vocabulary]
+        if len(ids) == 0:
+            return []
+        postings = np.concatenate([self.postings[self.indptr[i]:self.indptr[i + 1]] for i in ids])
+        shared = np.bincount(postings, minlength=len(self.names)).astype(np.float32)
+        candidates = np.flatnonzero(shared)
+        scores = shared[candidates] / (len(trigrams) + self.sizes[candidates] - shared[candidates])
+        # Ties (listings of the same company) are broken by the length of the symbol: AAPL before a warrant or unit
+        keys = scores.astype(np.float64) - 1e-6 * self.symbol_lengths[candidates]
+        if top_k < len(candidates):
+            keep = np.argpartition(-keys, top_k - 1)[:top_k]
+            candidates, scores, keys = candidates[keep], scores[keep], keys[keep]
+        order = np.argsort(-keys, kind="stable")
+        return [(self.names[candidates[i]], float(scores[i])) for i in order]
@@ -1,8 +1,12 @@
-from models.mock_api.pycragapi import CRAG
+from models.cache import LRUCache
+from models.mock_api.pycragapi import CRAG, CACHE_TTL
+from models.mock_api.tools.pricestore import PriceSeries, TimeSeries
+from models.mock_api.tools.company_index import CompanyIndex
+from models.mock_api.gazetteer import normalize_company_name
 
 class FinanceTools:
-    def __init__(self):
-        self.api = CRAG()
+    def __init__(self, api=None):
+        self.api = CRAG() if api is None else api
         name2symbol = {}
         symbol2name = {}
         all_symbols = []
@@ -19,19 +23,22 @@ class FinanceTools:
         self.name2symbol = name2symbol
         self.symbol2name = symbol2name
         self.all_symbols = all_symbols
+        # Company names are searched locally instead of with finance_get_company_name
+        self.company_index = CompanyIndex.from_symbol2name(symbol2name)
+        # ticker -> PriceSeries / TimeSeries, materialized once from the price and dividend histories
+        self.price_series = LRUCache(maxsize=256, ttl=CACHE_TTL.get('/finance/get_price_history'))
+        self.dividend_series = LRUCache(maxsize=256, ttl=CACHE_TTL.get('/finance/get_dividends_history'))
 
     def get_ticker_names(self, query):
         company_names = self.get_company_name(query)
         ticker_names = []
-        if company_names is None or len(company_names) == 0:
-            return []
-        else:
-            for company_name in company_names:
-                if company_name.lower() in query.lower():
-                    ticker_names.append(self.get_ticker_by_name(company_name))
+        query = " ".join(normalize_company_name(query))
+        for company_name in company_names:
+            if f" {' '.join(normalize_company_name(company_name))} " in f" {query} ":
+                ticker_names.append(self.get_ticker_by_name(company_name))
         return ticker_names
     
-    def get_company_name(self, query):
+    def get_company_name(self, query, top_k=10):
         """
         Given a query, return top matched company names.
         arg:
@@ -39,17 +46,23 @@ class FinanceTools:
         output:
             top matched company names: list[str]
         """
-        return self.api.finance_get_company_name(query)['result']
+        return [name for name, _ in self.company_index.search(query, top_k)]
 
-    def get_ticker_by_name(self, company_name):
+    def get_ticker_by_name(self, company_name, min_score=0.5):
         """
         Return ticker name by company name.
         arg:
             company_name: the company name: str
+            min_score: minimum similarity of the closest name when there is no exact match: float
         output:
-            the ticker name of the company: str
-        """
-        return self.api.finance_get_ticker_by_name(company_name)['result']
+            the ticker name of the company, None if no name is close enough: str
+        """
+        symbol = self.name2symbol.get(company_name.strip().lower())
+        if symbol is None:
+            matches = self.company_index.search(company_name, 1)
+            if len(matches) > 0 and matches[0][1] >= min_score:
+                symbol = self.name2symbol[matches[0][0].lower()]
+        return symbol
     
     def get_price_history(self, ticker_name):
         """
@@ -114,12 +127,46 @@ class FinanceTools:
              'Close': 17.09014892578125,
              'Volume': 45100}
         """
-        date = date + ' 00:00:00 EST'
-        if self.get_price_history(ticker_name.upper()) is None:
-            return None
-        if date not in self.get_price_history(ticker_name.upper()):
+        series = self.get_price_series(ticker_name)
+        if series is None:
             return None
-        return self.get_price_history(ticker_name.upper())[date]
+        return series.price_on(date)
+
+    def get_price_series(self, ticker_name):
+        """
+        Return the 1 year daily price history of the ticker as a PriceSeries (sorted NumPy columns), None if there is no history.
+        arg:
+            ticker_name: str, upper case
+        output:
+            price series: PriceSeries
+        """
+        ticker_name = ticker_name.upper()
+        series = self.price_series.get(ticker_name)
+        if series is None:
+            prices = self.get_price_history(ticker_name)
+            if prices is None:
+                return None
+            series = PriceSeries(prices)
+            self.price_series.set(ticker_name, series)
+        return series
+
+    def get_dividend_series(self, ticker_name):
+        """
+        Return the dividend history of the ticker as a TimeSeries (column 'Value'), None if there is no history.
+        arg:
+            ticker_name: str, upper case
+        output:
+            dividend series: TimeSeries
+        """
+        ticker_name = ticker_name.upper()
+        series = self.dividend_series.get(ticker_name)
+        if series is None:
+            dividends = self.get_dividends_history(ticker_name)
+            if dividends is None:
+                return None
+            series = TimeSeries(dividends)
+            self.dividend_series.set(ticker_name, series)
+        return series
     
     def get_latest_price(self, ticker_name, date):
         """
@@ -130,14 +177,10 @@ class FinanceTools:
         output:
             the latest price of the ticker before the given date: dict
         """
-        prices = self.get_price_history(ticker_name.upper())
-        dates = list(prices.keys())
-        dates.sort(reverse=True)
-        for d in dates:
-            if d[:10] < date:
-                latest_price = prices[d]
-                break
-        return latest_price
+        series = self.get_price_series(ticker_name)
+        if series is None:
+            return None
+        return series.latest_before(date)
     
     def get_detailed_price_history(self, ticker_name):
         """ 
@@ -226,14 +269,13 @@ class FinanceTools:
         output:
             the latest dividend of the ticker before the given date: float
         """
-        dividends = self.get_dividends_history(ticker_name.upper())
-        dates = list(dividends.keys())
-        dates.sort(reverse=True)
-        for d in dates:
-            if d[:10] < date:
-                latest_dividend = dividends[d]
-                break
-        return {d: latest_dividend}
+        series = self.get_dividend_series(ticker_name)
+        if series is None:
+            return None
+        i = series.index_before(date)
+        if i is None:
+            return None
+        return {series.keys[i]: series.column('Value')[i].item()}
     
     def get_dividends_history_by_year(self, ticker_name, year):
         """
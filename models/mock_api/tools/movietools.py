@@ -1,8 +1,9 @@
-from models.mock_api.pycragapi import CRAG
+from models.mock_api.pycragapi import CRAG, AsyncCRAG
 
 class MovieTools:
-    def __init__(self):
-        self.api = CRAG()
+    def __init__(self, api=None, async_api=None):
+        self.api = CRAG() if api is None else api
+        self.async_api = AsyncCRAG() if async_api is None else async_api
 
     def get_movie_id(self, movie_name):
         movies_info = self.get_movie_info(movie_name)
@@ -35,3 +36,17 @@ class MovieTools:
     def get_person_info_by_id(self, person_id):
         return self.api.movie_get_person_info_by_id(person_id)['result']
 
+    async def aget_movie_info_by_id(self, movie_id):
+        return (await self.async_api.movie_get_movie_info_by_id(movie_id))['result']
+
+    async def aget_person_info_by_id(self, person_id):
+        return (await self.async_api.movie_get_person_info_by_id(person_id))['result']
+
+    def get_movies_info_by_ids(self, movie_ids, fields=None):
+        """
+        The information of a list of movies in one request (concurrent requests if the server has no bulk endpoint),
+        results are in the order of the ids. `fields` (e.g. ['title', 'original_title']) keeps only these keys.
+        """
+        if len(movie_ids) == 0:
+            return []
+        return self.async_api.run(self.async_api.movie_get_movie_info_by_ids(movie_ids, fields))['result']
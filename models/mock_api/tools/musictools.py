@@ -1,8 +1,9 @@
-from models.mock_api.pycragapi import CRAG
+from models.mock_api.pycragapi import CRAG, AsyncCRAG
 
 class MusicTools:
-    def __init__(self):
-        self.api = CRAG()
+    def __init__(self, api=None, async_api=None):
+        self.api = CRAG() if api is None else api
+        self.async_api = AsyncCRAG() if async_api is None else async_api
 
     def get_artist_name(self, name):
         names = self.search_artist_entity_by_name(name)
@@ -233,4 +234,16 @@ class MusicTools:
             work_list (list): the list of all work names
 
         """
-        return self.api.music_get_artist_all_works(artist_name)['result']
\ No newline at end of file
+        return self.api.music_get_artist_all_works(artist_name)['result']
+
+    async def aget_song_release_date(self, song_name):
+        return (await self.async_api.music_get_song_release_date(song_name))['result']
+
+    async def aget_artist_all_works(self, artist_name):
+        return (await self.async_api.music_get_artist_all_works(artist_name))['result']
+
+    def get_songs_release_date(self, song_names):
+        """
+        Concurrent version of get_song_release_date for a list of songs, results are in the order of the songs.
+        """
+        return self.async_api.map(self.aget_song_release_date, song_names)
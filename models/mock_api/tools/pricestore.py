@@ -0,0 +1,129 @@
+import datetime
+import numpy as np
+
+EPOCH = datetime.date(1970, 1, 1)
+
+
+def to_epoch_day(date:str) -> int:
+    """
+    'YYYY-MM-DD' (or any string starting with it, e.g. '2024-02-22 00:00:00 EST') -> days since 1970-01-01
+    """
+    return (datetime.date(int(date[0:4]), int(date[5:7]), int(date[8:10])) - EPOCH).days
+
+
+def from_epoch_day(day:int) -> str:
+    return (EPOCH + datetime.timedelta(days=int(day))).strftime("%Y-%m-%d")
+
+
+class TimeSeries:
+    """
+    A daily time series materialized once into sorted NumPy columns, dates are stored as int64 epoch days.
+    Lookups by date are binary searches, aggregates are vectorized over index arrays or slices.
+
+    Args:
+        history: {'2023-02-28 00:00:00 EST': {'Open': 17.25, ..., 'Volume': 45100}, ...} or {'2019-12-19 00:00:00 EST': 0.058, ...}
+        columns: the keys of the rows to keep, None if the values are scalars (stored in the column 'Value')
+    """
+    def __init__(self, history:dict, columns=None):
+        keys = sorted(history.keys())
+        self.keys = keys
+        self.days = np.array([to_epoch_day(key) for key in keys], dtype=np.int64)
+        if columns is None:
+            self.columns = {'Value': np.array([history[key] for key in keys], dtype=np.float64)}
+        else:
+            self.columns = {
+                column: np.array([history[key][column] for key in keys], dtype=np.int64 if column == 'Volume' else np.float64)
+                for column in columns
+            }
+
+    def __len__(self):
+        return len(self.days)
+
+    def index_on(self, date:str):
+        """
+        Index of the given date, None if it is not in the series.
+        """
+        day = to_epoch_day(date)
+        i = int(np.searchsorted(self.days, day, side="left"))
+        if i < len(self.days) and self.days[i] == day:
+            return i
+        return None
+
+    def index_before(self, date:str):
+        """
+        Index of the latest date strictly before the given date, None if there is none.
+        """
+        i = int(np.searchsorted(self.days, to_epoch_day(date), side="left")) - 1
+        return i if i >= 0 else None
+
+    def index_on_or_after(self, date:str):
+        """
+        Index of the first date on or after the given date, None if there is none.
+        """
+        i = int(np.searchsorted(self.days, to_epoch_day(date), side="left"))
+        return i if i < len(self.days) else None
+
+    def range(self, start:str, end:str):
+        """
+        Slice of the dates between start and end (both inclusive).
+        """
+        i = int(np.searchsorted(self.days, to_epoch_day(start), side="left"))
+        j = int(np.searchsorted(self.days, to_epoch_day(end), side="right"))
+        return slice(i, j)
+
+    def take(self, dates):
+        """
+        Indices of the given dates which are in the series, in the order of `dates`.
+        """
+        if len(dates) == 0 or len(self.days) == 0:
+            return np.array([], dtype=np.int64)
+        days = np.array([to_epoch_day(date) for date in dates], dtype=np.int64)
+        idx = np.minimum(np.searchsorted(self.days, days, side="left"), len(self.days) - 1)
+        return idx[self.days[idx] == days]
+
+    def date_at(self, i) -> str:
+        return from_epoch_day(self.days[i])
+
+    def column(self, name, idx=None):
+        values = self.columns[name]
+        return values if idx is None else values[idx]
+
+    def row(self, i) -> dict:
+        return {name: values[i].item() for name, values in self.columns.items()}
+
+    def value_on(self, date:str):
+        i = self.index_on(date)
+        return self.row(i) if i is not None else None
+
+    def latest_before(self, date:str):
+        i = self.index_before(date)
+        return self.row(i) if i is not None else None
+
+    def aggregate(self, idx=None) -> dict:
+        """
+        Mean, min, max and sum of every column over the given indices (or slice), e.g. {'Open': {'mean': ..., 'min': ..., ...}, ...}
+        """
+        results = {}
+        for name, values in self.columns.items():
+            values = values if idx is None else values[idx]
+            if len(values) == 0:
+                results[name] = {'mean': None, 'min': None, 'max': None, 'sum': None}
+                continue
+            results[name] = {
+                'mean': values.mean().item(),
+                'min': values.min().item(),
+                'max': values.max().item(),
+                'sum': values.sum().item(),
+            }
+        return results
+
+
+class PriceSeries(TimeSeries):
+    """
+    Daily Open, High, Low, Close prices (float64) and Volume (int64) of a ticker.
+    """
+    def __init__(self, history:dict):
+        super().__init__(history, columns=['Open', 'High', 'Low', 'Close', 'Volume'])
+
+    def price_on(self, date:str):
+        return self.value_on(date)
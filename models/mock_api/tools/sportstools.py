@@ -1,8 +1,9 @@
-from models.mock_api.pycragapi import CRAG
+from models.mock_api.pycragapi import CRAG, AsyncCRAG
 
 class SportsTools:
-    def __init__(self):
-        self.api = CRAG()
+    def __init__(self, api=None, async_api=None):
+        self.api = CRAG() if api is None else api
+        self.async_api = AsyncCRAG() if async_api is None else async_api
         self.nba_teams = ["Atlanta Hawks", "Boston Celtics", "Brooklyn Nets", "Charlotte Hornets", "Chicago Bulls", "Cleveland Cavaliers", "Dallas Mavericks", "Denver Nuggets", "Detroit Pistons", "Golden State Warriors", "Houston Rockets", "Indiana Pacers", "Los Angeles Clippers", "Los Angeles Lakers", "Memphis Grizzlies", "Miami Heat", "Milwaukee Bucks", "Minnesota Timberwolves", "New Orleans Pelicans", "New York Knicks", "Oklahoma City Thunder", "Orlando Magic", "Philadelphia 76ers", "Phoenix Suns", "Portland Trail Blazers", "Sacramento Kings", "San Antonio Spurs", "Toronto Raptors", "Utah Jazz", "Washington Wizards"]
         self.nba_teams_alter = {
             "Atlanta Hawks": ["Hawks", "Atlanta", "ATL"],
@@ -143,6 +144,19 @@ class SportsTools:
             Output: a json contains info of the games
         """
         games = self.api.sports_soccer_get_games_on_date(date_str, soccer_team_name)['result']
+        return self.soccer_games_to_rows(games)
+
+    async def asoccer_get_games_on_date(self, date_str:str, soccer_team_name:str = None):
+        games = (await self.async_api.sports_soccer_get_games_on_date(date_str, soccer_team_name))['result']
+        return self.soccer_games_to_rows(games)
+
+    def soccer_get_games_on_dates(self, date_strs:list, soccer_team_name:str = None):
+        """ 
+            Description: Concurrent version of soccer_get_games_on_date for a list of date_str, results are in the order of date_strs
+        """
+        return self.async_api.map(lambda date_str: self.asoccer_get_games_on_date(date_str, soccer_team_name), date_strs)
+
+    def soccer_games_to_rows(self, games):
         games_ = {}
         if games is None:
             return None
@@ -167,6 +181,9 @@ class SportsTools:
         """
         return self.api.sports_nba_get_games_on_date(date_str, nba_team_name)['result']
 
+    async def anba_get_games_on_date(self, date_str:str, nba_team_name:str = None):
+        return (await self.async_api.sports_nba_get_games_on_date(date_str, nba_team_name))['result']
+
     def nba_get_play_by_play_data_by_game_ids(self, game_ids: list):
         """ 
             Description: Get all nba play by play rows given game ids
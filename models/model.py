@@ -1,9 +1,9 @@
 from typing import Any, Dict, List
 from models.mock_api.api import MockAPI
+from models.router.router import MultiHeadSequenceClassificationRouter
 from prompts.templates import *
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnableLambda
 
 class RAGModel:
     """
@@ -62,11 +62,21 @@ class RAGModel:
         self.domain_router = domain_router
         self.dynamic_router = dynamic_router
 
-    def retrieve(self, input):
-        query = input["query"]
-        interaction_id = input["interaction_id"]
-        search_results = input["search_results"]
-        return self.retriever.retrieve(query, interaction_id, search_results)
+    def route(self, queries):
+        """
+        Returns the domain and the dynamism (None if there is no dynamic router) of each query.
+        """
+        if isinstance(self.domain_router, MultiHeadSequenceClassificationRouter):
+            routes = self.domain_router.route_batch(queries)
+            domains = [route[0] for route in routes]
+            dynamics = [route[1] if len(route) > 1 else None for route in routes]
+            return domains, dynamics
+        domains = self.domain_router.route_batch(queries)
+        if self.dynamic_router is not None:
+            dynamics = self.dynamic_router.route_batch(queries)
+        else:
+            dynamics = [None] * len(queries)
+        return domains, dynamics
 
     def batch_generate_answer(self, batch: Dict[str, Any]) -> List[str]:
         """
@@ -97,49 +107,58 @@ class RAGModel:
         batch_search_results = batch["search_results"]
         query_times = batch["query_time"]
 
+        domains, dynamics = self.route(queries)
 
+        # Decide answers by rules before retrieval, only the remaining queries go through the RAG pipeline
+        answers = [self.get_rule_answer(query, domain, dynamic) for query, domain, dynamic in zip(queries, domains, dynamics)]
+        pending = [i for i, answer in enumerate(answers) if answer is None]
+        if len(pending) == 0:
+            return answers
 
-        batch_retrieval_results = RunnableLambda(self.retrieve).batch([{"query": query, "interaction_id": interaction_id, "search_results": search_results} for query, interaction_id, search_results in zip(queries, batch_interaction_ids, batch_search_results)])
-
-        domains = [self.domain_router(query) for query in queries]
-        if self.dynamic_router is not None:    
-            dynamics = [self.dynamic_router(query) for query in queries]
+        queries_ = [queries[i] for i in pending]
+        query_times_ = [query_times[i] for i in pending]
+        domains_ = [domains[i] for i in pending]
+        batch_retrieval_results = self.retriever.retrieve_batch(queries_, [batch_interaction_ids[i] for i in pending], [batch_search_results[i] for i in pending])
 
         # Get KG information
         if self.use_kg:
-            kg_infos = self.api.get_kg_info(queries, query_times, domains)
-            inputs = [{"query": query, "query_time": query_time, "kg_info": kg_info, "retrieval_results": retrieval_results, "domain": domain} for query, query_time, kg_info, retrieval_results, domain in zip(queries, query_times, kg_infos, batch_retrieval_results, domains)]
+            kg_infos = self.api.get_kg_info(queries_, query_times_, domains_)
+            inputs = [{"query": query, "query_time": query_time, "kg_info": kg_info, "retrieval_results": retrieval_results, "domain": domain} for query, query_time, kg_info, retrieval_results, domain in zip(queries_, query_times_, kg_infos, batch_retrieval_results, domains_)]
         else:
-            inputs = [{"query": query, "query_time": query_time, "retrieval_results": retrieval_results, "domain": domain} for query, query_time, retrieval_results, domain in zip(queries, query_times, batch_retrieval_results, domains)]
+            inputs = [{"query": query, "query_time": query_time, "retrieval_results": retrieval_results, "domain": domain} for query, query_time, retrieval_results, domain in zip(queries_, query_times_, batch_retrieval_results, domains_)]
 
         # Generate responses via vllm
         responses = self.rag_chain.batch(inputs)
 
         # Aggregate answers into List[str]
-        answers = []
-        for i, answer in enumerate(responses):
-            if self.use_kg:
-                if domains[i] in ["open"] and self.dynamic_router and dynamics[i] in ["fast-changing", "real-time"]:
-                    answer = "I don't know"
-
-                if domains[i] in ["open", "movie", "music"] and "average" in queries[i]:
-                    answer = "I don't know"
-            else:
-                if self.dynamic_router and dynamics[i] in ["fast-changing", "real-time"]:
-                    answer = "I don't know"
-                elif domains[i] in ["finance"]:
-                    answer = "I don't know"
-                if "average" in queries[i]:
-                    answer = "I don't know"
-
-            if "how many shares" in queries[i] or "legal tender" in queries[i] or "whick five" in queries[i] or "low and high" in queries[i]:
-                answer = "I don't know"
+        for i, answer in zip(pending, responses):
             if "$0.01" in answer:
                 answer = "I don't know"
-            
-            answers.append(answer)
+            answers[i] = answer
   
         return answers
+
+    def get_rule_answer(self, query, domain, dynamic=None):
+        """
+        Returns "I don't know" if the answer of the query is already decided by rules, otherwise None.
+        These rules only depend on the query and the routers, so they are evaluated before retrieval and LLM calls.
+        """
+        if self.use_kg:
+            if domain in ["open"] and dynamic in ["fast-changing", "real-time"]:
+                return "I don't know"
+            if domain in ["open", "movie", "music"] and "average" in query:
+                return "I don't know"
+        else:
+            if dynamic in ["fast-changing", "real-time"]:
+                return "I don't know"
+            elif domain in ["finance"]:
+                return "I don't know"
+            if "average" in query:
+                return "I don't know"
+
+        if "how many shares" in query or "legal tender" in query or "whick five" in query or "low and high" in query:
+            return "I don't know"
+        return None
     
     def get_reference(self, retrieval_results):
         references = ""
@@ -0,0 +1,164 @@
+import os
+import re
+import platform
+import numpy as np
+import onnxruntime
+from typing import Any, List
+from pydantic import Field, PrivateAttr
+from transformers import AutoTokenizer
+from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTModelForSequenceClassification, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+# Exported (and quantized) ONNX graphs, one directory per model and task
+ONNX_CACHE_DIR = os.getenv("CRAG_ONNX_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx_cache"))
+ORT_MODEL_CLASSES = {
+    "feature-extraction": ORTModelForFeatureExtraction,
+    "text-classification": ORTModelForSequenceClassification,
+}
+# Instruction set the int8 graphs are quantized for: "avx512_vnni", "avx512", "avx2" or "arm64", detected if unset
+ONNX_CPU_TARGET = os.getenv("CRAG_ONNX_CPU_TARGET")
+QUANTIZATION_CONFIGS = {
+    "avx512_vnni": lambda: AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=True),
+    # Without VNNI the U8S8 products can saturate, the weights are quantized to 7 bits (reduce_range) to avoid it
+    "avx512": lambda: AutoQuantizationConfig.avx512(is_static=False, per_channel=True, reduce_range=True),
+    "avx2": lambda: AutoQuantizationConfig.avx2(is_static=False, per_channel=True, reduce_range=True),
+    "arm64": lambda: AutoQuantizationConfig.arm64(is_static=False, per_channel=True),
+}
+
+
+def get_session_options(num_threads=None):
+    """
+    ONNX Runtime session options, `num_threads` is the intra-op thread count (all the cores if None).
+    """
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if num_threads is not None:
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+    return options
+
+
+def detect_cpu_target():
+    """
+    The QUANTIZATION_CONFIGS key of this CPU, from its architecture and /proc/cpuinfo flags (avx2 if unknown).
+    """
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64"
+    flags = set()
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    flags = set(line.split(":", 1)[1].split())
+                    break
+    except OSError:
+        pass
+    if "avx512_vnni" in flags:
+        return "avx512_vnni"
+    if "avx512f" in flags:
+        return "avx512"
+    return "avx2"
+
+
+def export_onnx(model_path, task, quantize=True, cache_dir=ONNX_CACHE_DIR, cpu_target=ONNX_CPU_TARGET):
+    """
+    Export the HuggingFace model to ONNX and, if `quantize`, apply dynamic int8 quantization (int8 weights,
+    activations quantized on the fly) for `cpu_target` (see QUANTIZATION_CONFIGS, detected if None). Both are done
+    once and cached. Returns the model directory and file name.
+    """
+    name = re.sub(r"[^A-Za-z0-9_.-]+", "_", os.path.normpath(model_path)).strip("_")
+    export_dir = os.path.join(cache_dir, name, task, "fp32")
+    if not os.path.exists(os.path.join(export_dir, "model.onnx")):
+        model = ORT_MODEL_CLASSES[task].from_pretrained(model_path, export=True)
+        model.save_pretrained(export_dir)
+    if not quantize:
+        return export_dir, "model.onnx"
+    cpu_target = detect_cpu_target() if cpu_target is None else cpu_target
+    if cpu_target not in QUANTIZATION_CONFIGS:
+        raise ValueError(f"Unknown CPU target: {cpu_target}, expected one of {list(QUANTIZATION_CONFIGS)}")
+    quantized_dir = os.path.join(cache_dir, name, task, f"int8-{cpu_target}")
+    if not os.path.exists(os.path.join(quantized_dir, "model_quantized.onnx")):
+        quantizer = ORTQuantizer.from_pretrained(export_dir, file_name="model.onnx")
+        quantizer.quantize(save_dir=quantized_dir, quantization_config=QUANTIZATION_CONFIGS[cpu_target]())
+    return quantized_dir, "model_quantized.onnx"
+
+
+def load_ort_model(model_path, task, quantize=True, num_threads=None):
+    """
+    The ONNX Runtime (CPU) model of a HuggingFace checkpoint, exported on first use.
+    """
+    model_dir, file_name = export_onnx(model_path, task, quantize)
+    return ORT_MODEL_CLASSES[task].from_pretrained(
+        model_dir,
+        file_name=file_name,
+        provider="CPUExecutionProvider",
+        session_options=get_session_options(num_threads),
+    )
+
+
+class ONNXEmbedding(BaseEmbedding):
+    """
+    A llama-index embedding model running an ONNX (int8 by default) export of a sentence embedding model on CPU.
+    Embeddings are the normalized [CLS] hidden states, as for bge-m3.
+    """
+    max_length: int = Field(default=1024, description="Maximum number of tokens per text.")
+    _model: Any = PrivateAttr()
+    _tokenizer: Any = PrivateAttr()
+
+    def __init__(self, model_name, num_threads=None, quantize=True, max_length=1024, embed_batch_size=32, **kwargs):
+        super().__init__(model_name=model_name, max_length=max_length, embed_batch_size=embed_batch_size, **kwargs)
+        self._model = load_ort_model(model_name, "feature-extraction", quantize, num_threads)
+        self._tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ONNXEmbedding"
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        inputs = self._tokenizer(texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np")
+        embeddings = self._model(**inputs).last_hidden_state[:, 0]
+        embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings.tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts)
+
+    # LangChain Embeddings interface, used by build_vector_db
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.get_text_embedding_batch(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.get_query_embedding(text)
+
+
+class ONNXCrossEncoder:
+    """
+    ONNX (int8 by default) CPU counterpart of sentence_transformers.CrossEncoder.predict, for a single label
+    reranker such as bge-reranker-v2-m3 (scores are the sigmoid of the logits, as CrossEncoder does).
+    """
+    def __init__(self, model_path, num_threads=None, quantize=True, max_length=512):
+        self.model = load_ort_model(model_path, "text-classification", quantize, num_threads)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.max_length = max_length
+
+    def predict(self, pairs, batch_size=32, **kwargs):
+        scores = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            inputs = self.tokenizer(
+                [query for query, _ in batch], [candidate for _, candidate in batch],
+                padding=True, truncation=True, max_length=self.max_length, return_tensors="np",
+            )
+            logits = self.model(**inputs).logits
+            scores.append(1 / (1 + np.exp(-logits[:, 0])))
+        return np.concatenate(scores) if len(scores) > 0 else np.zeros(0, dtype=np.float32)
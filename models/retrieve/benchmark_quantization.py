@@ -0,0 +1,131 @@
+# Recall of the quantized search against the exact float search, on a flat index built by build_vector_db
+# Run from the root of the repository:
+#   python -m models.retrieve.benchmark_quantization --index-path models/retrieve/flat_index/bge_m3_crag_dev_v3_llamaindex --input models/retrieve/data/crag_task_1_dev_v3_release.jsonl.bz2
+# The index may be built with any quantization (but with its float vectors), the int8 and binary codes are computed
+# here from its float16 vectors. "rescore x 0" is an index built with --no-float-vectors: ranked by the quantized
+# scores only. "disk B/vec" counts everything such an index stores per vector (the float16 copy included when
+# rescoring), "read B/vec" the bytes a search actually touches per vector of the interaction.
+# --compare-index-path measures a real index of the same input, e.g. built with --quantization int8 --no-float-vectors,
+# against the exact search: the benchmark fails (exit code 1) if its recall is below --min-recall.
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from models.retrieve.build_vector_db import read_interactions
+from models.retrieve.embedding_cache import EmbeddingCache, CHUNK_PARAMS
+from models.retrieve.flat_index import FlatIndex
+from models.retrieve.quantization import quantize_int8, quantize_binary, int8_scores, binary_scores, top_k_indices, rescore_top_k
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Recall@top_k of int8 / binary search with float rescoring on a flat index")
+    parser.add_argument("--index-path", required=True)
+    parser.add_argument("--input", nargs="+", required=True, help="the dataset the index was built from, for the queries")
+    parser.add_argument("--embedding-model", default="models/retrieve/embedding_models/bge-m3")
+    parser.add_argument("--device", default="cuda")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rescore-multipliers", type=int, nargs="+", default=[0, 1, 2, 4, 8])
+    parser.add_argument("--num-queries", type=int, default=500)
+    parser.add_argument("--compare-index-path", default=None, help="an index built from the same input with another quantization (e.g. --no-float-vectors), searched as Retriever_Flat does")
+    parser.add_argument("--rescore-multiplier", type=int, default=4, help="rescore multiplier of the searches of --compare-index-path")
+    parser.add_argument("--min-recall", type=float, default=0.95, help="recall tolerance, the rows below it are flagged")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    index = FlatIndex(args.index_path)
+    if not index.float_vectors:
+        raise ValueError(f"{args.index_path} was built without its float vectors, the exact search needs them")
+    compared = FlatIndex(args.compare_index_path) if args.compare_index_path is not None else None
+    queries = []
+    for d in read_interactions(args.input):
+        if d["interaction_id"] in index and index.get_rows(d["interaction_id"]).stop > index.get_rows(d["interaction_id"]).start:
+            queries.append(d)
+        if len(queries) == args.num_queries:
+            break
+
+    embedding_model = HuggingFaceEmbedding(model_name=args.embedding_model, device=args.device)
+    query_embeddings = EmbeddingCache(args.embedding_model, CHUNK_PARAMS).embed(
+        [d["query"] for d in queries], lambda texts: [embedding_model.get_query_embedding(text) for text in texts], kind="query"
+    )
+    query_embeddings = query_embeddings / np.maximum(np.linalg.norm(query_embeddings, axis=1, keepdims=True), 1e-12)
+
+    recalls = {("float16", 1): []}
+    for quantization in ("int8", "binary"):
+        for multiplier in args.rescore_multipliers:
+            recalls[(quantization, multiplier)] = []
+    times = {key: 0.0 for key in recalls}
+    dim = index.dim
+    quantized_bytes = {"float16": dim * 2, "int8": dim + 4, "binary": (dim + 7) // 8}
+    read_bytes = {key: 0 for key in recalls}
+    num_rows = 0
+    compared_recalls, compared_time = [], 0.0
+
+    for d, query_embedding in zip(queries, query_embeddings):
+        vectors = np.asarray(index.vectors[index.get_rows(d["interaction_id"])], dtype=np.float32)
+        start = time.perf_counter()
+        exact = top_k_indices(vectors @ query_embedding, args.top_k)
+        times[("float16", 1)] += time.perf_counter() - start
+        recalls[("float16", 1)].append(1.0)
+        read_bytes[("float16", 1)] += len(vectors) * dim * 2
+        num_rows += len(vectors)
+        codes, scales = quantize_int8(vectors)
+        bits = quantize_binary(vectors)
+        rescore = lambda idx: vectors[idx] @ query_embedding
+        for (quantization, multiplier) in recalls:
+            if quantization == "float16":
+                continue
+            start = time.perf_counter()
+            if quantization == "int8":
+                candidate_scores = int8_scores(codes, scales, query_embedding)
+            else:
+                candidate_scores = binary_scores(bits, query_embedding)
+            if multiplier == 0:
+                top = top_k_indices(candidate_scores, args.top_k)
+            else:
+                top = rescore_top_k(candidate_scores, rescore, args.top_k, multiplier)
+            times[(quantization, multiplier)] += time.perf_counter() - start
+            read_bytes[(quantization, multiplier)] += len(vectors) * quantized_bytes[quantization] + min(args.top_k * multiplier, len(vectors)) * dim * 2
+            recalls[(quantization, multiplier)].append(len(set(top.tolist()) & set(exact.tolist())) / len(exact))
+        # The rows of an interaction are the same in both indexes as long as they were built from the same input
+        compared_rows = compared.get_rows(d["interaction_id"]) if compared is not None else None
+        if compared is not None and compared_rows.stop - compared_rows.start == len(vectors):
+            start = time.perf_counter()
+            top = compared.search(d["interaction_id"], query_embedding, args.top_k, args.rescore_multiplier)
+            compared_time += time.perf_counter() - start
+            compared_recalls.append(len(set(np.asarray(top).tolist()) & set(exact.tolist())) / len(exact))
+
+    print(f"{len(queries)} queries, dim {dim}, recall@{args.top_k} against the exact float search")
+    print(f"{'storage':<10}{'rescore x':>10}{'disk B/vec':>12}{'read B/vec':>12}{'read vs f16':>12}{'recall':>10}{'ms/query':>10}")
+    for (quantization, multiplier), values in recalls.items():
+        # Rescoring needs the float16 copy on disk, next to the quantized rows
+        disk = quantized_bytes[quantization] + (dim * 2 if quantization != "float16" and multiplier > 0 else 0)
+        read = read_bytes[(quantization, multiplier)] / max(num_rows, 1)
+        print(
+            f"{quantization:<10}{multiplier:>10}{disk:>12}{read:>12.1f}{dim * 2 / max(read, 1e-9):>11.1f}x"
+            f"{np.mean(values):>10.4f}{1000 * times[(quantization, multiplier)] / max(len(queries), 1):>10.3f}"
+            f"{'' if np.mean(values) >= args.min_recall else f'  below {args.min_recall}'}"
+        )
+    for path, flat_index in [(args.index_path, index)] + ([(args.compare_index_path, compared)] if compared is not None else []):
+        print(f"Files of {path} ({flat_index.quantization or 'float16'}, float vectors: {flat_index.float_vectors}):")
+        sizes = {name: os.path.getsize(os.path.join(path, name)) for name in sorted(os.listdir(path))}
+        for name, size in sizes.items():
+            print(f"    {name:<20}{size:>16,} B")
+        print(f"    {'total':<20}{sum(sizes.values()):>16,} B")
+
+    if compared is not None:
+        recall = np.mean(compared_recalls) if len(compared_recalls) > 0 else 0.0
+        print(
+            f"{args.compare_index_path}: recall@{args.top_k} {recall:.4f} on {len(compared_recalls)} queries "
+            f"(rescore x {args.rescore_multiplier if compared.float_vectors else 0}), {1000 * compared_time / max(len(compared_recalls), 1):.3f} ms/query"
+        )
+        if recall < args.min_recall:
+            print(f"Recall below the tolerance {args.min_recall}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import re
+import functools
+import numpy as np
+import Stemmer
+
+# Same tokenization as the BM25Retriever of llama-index (bm25s): lowercased words of 2+ characters,
+# English (Lucene) stopwords removed, Snowball English stemmer
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+STOPWORDS = frozenset([
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "if", "in", "into", "is", "it", "no", "not",
+    "of", "on", "or", "such", "that", "the", "their", "then", "there", "these", "they", "this", "to", "was",
+    "will", "with",
+])
+
+
+@functools.lru_cache(maxsize=None)
+def get_stemmer():
+    return Stemmer.Stemmer("english")
+
+
+@functools.lru_cache(maxsize=1 << 20)
+def stem(word):
+    return get_stemmer().stemWord(word)
+
+
+def tokenize(text):
+    return [stem(word) for word in TOKEN_PATTERN.findall(text.lower()) if word not in STOPWORDS]
+
+
+class BM25:
+    """
+    BM25 (Lucene variant) over a small in-memory corpus, e.g. the chunks of the search results of one query.
+    Documents are tokenized once, a query is scored against all of them in one vectorized pass over the
+    term frequencies of the query terms only.
+
+    Example:
+        bm25 = BM25(texts)
+        top = bm25.retrieve(query, similarity_top_k=50)  # indices of the best texts, best first
+    """
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs = [tokenize(text) for text in texts]
+        self.doc_lens = np.array([len(doc) for doc in self.docs], dtype=np.float32)
+        self.avg_doc_len = max(float(self.doc_lens.mean()), 1.0) if len(self.docs) > 0 else 1.0
+
+    def __len__(self):
+        return len(self.docs)
+
+    def get_scores(self, query):
+        terms = list(dict.fromkeys(tokenize(query)))
+        if len(terms) == 0 or len(self.docs) == 0:
+            return np.zeros(len(self.docs), dtype=np.float32)
+        term_ids = {term: i for i, term in enumerate(terms)}
+        # Flat (doc, term) ids of the occurrences of query terms, counted into a (num_docs, num_terms) matrix
+        ids = [
+            d * len(terms) + term_ids[token]
+            for d, doc in enumerate(self.docs) for token in doc if token in term_ids
+        ]
+        tf = np.bincount(np.array(ids, dtype=np.int64), minlength=len(self.docs) * len(terms))
+        tf = tf.reshape(len(self.docs), len(terms)).astype(np.float32)
+        df = (tf > 0).sum(axis=0)
+        idf = np.log(1 + (len(self.docs) - df + 0.5) / (df + 0.5))
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lens / self.avg_doc_len)
+        return ((tf * (self.k1 + 1) / (tf + norm[:, None])) * idf).sum(axis=1)
+
+    def retrieve(self, query, similarity_top_k=10):
+        """
+        Indices of the `similarity_top_k` best documents (all of them if there are fewer), best first.
+        """
+        scores = self.get_scores(query)
+        return np.argsort(-scores, kind="stable")[:similarity_top_k].tolist()
@@ -1,88 +1,211 @@
 # Create an index over the documents
+# Run from the root of the repository, e.g. for task 1&2 and task 3:
+#   python -m models.retrieve.build_vector_db --input models/retrieve/data/crag_task_1_dev_v3_release.jsonl.bz2 --collection bge_m3_crag_dev_v3_llamaindex
+#   python -m models.retrieve.build_vector_db --input "models/retrieve/data/crag_task_3_dev_v3/crag_task_3_dev_v3_*.jsonl" --collection bge_m3_crag_task_3_dev_v3_llamaindex
+# The input is streamed, and completed interactions are checkpointed: rerunning the same command after a crash
+# resumes the build, pass --restart to build from scratch.
+import os
 import bz2
+import glob
 import json
+import shutil
+import argparse
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from tqdm import tqdm
 from langchain_milvus.vectorstores import Milvus
 from langchain_openai import OpenAIEmbeddings
 from langchain.embeddings import HuggingFaceBgeEmbeddings
-from langchain_core.runnables import RunnableLambda
-from langchain_core.documents import Document
-from retriever import get_all_chunks
-
-
-
-# embeddings = OpenAIEmbeddings(api_key="<your-api-key>", base_url="<your-base-url>")
-embeddings = HuggingFaceBgeEmbeddings(
-    model_name="embedding_models/bge-m3",
-    model_kwargs = {'device': 'cuda'},
-    encode_kwargs = {'normalize_embeddings': True}, # set True to compute cosine similarity
-    query_instruction = "",
-)
-
-# Milvus Server
-# uri = "http://localhost:19530"
-# Milvus Lite
-uri = "./milvus.db"
-
-collection_name = "bge_m3_crag_dev_v3_llamaindex"
-
-vectorstore = Milvus(
-    embeddings,
-    connection_args={"uri": uri},
-    collection_name=collection_name,
-    partition_key_field="interaction_id",
-    drop_old=True,
-    auto_id=True,
-    index_params={
-        "metric_type": "IP",
-        "index_type": "IVF_FLAT",
-        "params": {
-            "nlist": 65536
-        }
+from models.retrieve.retriever import chunk_pages, dedup_search_results, iter_pages_batch, init_ray, get_embedding_cache, get_embedding_model_name
+from models.retrieve.embedding_cache import CachedEmbeddings
+from models.retrieve.flat_index import FlatIndexWriter, FlatIndex
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the vector db (Milvus or flat index) of the search results of a CRAG dataset")
+    parser.add_argument("--input", nargs="+", required=True, help="bz2 or jsonl files, or glob patterns of shards")
+    parser.add_argument("--collection", required=True, help="Milvus collection name, also the default flat index name")
+    parser.add_argument("--backend", choices=["milvus", "flat"], default="milvus", help="flat: a local index read by Retriever_Flat (no server needed)")
+    # Milvus Server: http://localhost:19530, Milvus Lite: a local file
+    parser.add_argument("--uri", default="models/retrieve/milvus.db")
+    parser.add_argument("--index-path", default=None, help="flat index directory, models/retrieve/flat_index/<collection> by default")
+    parser.add_argument("--checkpoint", default=None, help="file of the completed interaction_ids (milvus backend)")
+    parser.add_argument("--embedding-model", default="models/retrieve/embedding_models/bge-m3")
+    parser.add_argument("--device", default="cuda")
+    parser.add_argument("--model-backend", choices=["torch", "onnx"], default="torch",
+                        help="embedding model backend, the same as the retriever's backend (onnx: int8 export on CPU)")
+    parser.add_argument("--num-threads", type=int, default=None, help="ONNX Runtime threads (onnx model backend)")
+    parser.add_argument("--batch-size", type=int, default=64, help="interactions per batch")
+    parser.add_argument("--embed-batch-size", type=int, default=256, help="chunks per forward pass of the embedding model")
+    parser.add_argument("--num-cpus", type=int, default=None, help="CPUs used by Ray for HTML extraction")
+    parser.add_argument("--num-workers", type=int, default=4, help="processes used for chunking")
+    parser.add_argument("--quantization", choices=["none", "int8", "binary"], default="none",
+                        help="quantized vectors, searched first and rescored in full precision: the float16 vectors are kept for "
+                             "rescoring, so the index is larger on disk and only reads fewer bytes per search (milvus: int8 only, "
+                             "an IVF_SQ8 index next to the raw float vectors)")
+    parser.add_argument("--no-float-vectors", dest="float_vectors", action="store_false",
+                        help="flat backend with --quantization: do not store the float16 vectors, the index is 2x (int8) or 16x "
+                             "(binary) smaller but searches rank by the quantized scores only (check the recall with benchmark_quantization)")
+    parser.add_argument("--restart", action="store_true", help="drop the existing collection / index and checkpoint")
+    args = parser.parse_args()
+    args.quantization = None if args.quantization == "none" else args.quantization
+    if args.backend == "milvus" and args.quantization == "binary":
+        parser.error("binary quantization is only supported by the flat backend")
+    if not args.float_vectors and (args.backend != "flat" or args.quantization is None):
+        parser.error("--no-float-vectors requires the flat backend and a quantization")
+    return args
+
+
+def read_interactions(patterns):
+    """
+    Stream the interactions of the (bz2 or plain) jsonl files, in order.
+    """
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            with (bz2.open(path, "rt") if path.endswith(".bz2") else open(path, "r")) as f:
+                for line in f:
+                    if line.strip() == "":
+                        continue
+                    data = json.loads(line)
+                    yield {"interaction_id": data["interaction_id"], "query": data["query"], "search_results": data["search_results"]}
+
+
+def read_batches(interactions, batch_size, done):
+    batch = []
+    for d in interactions:
+        if d["interaction_id"] in done:
+            continue
+        batch.append(d)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+
+def prepare_batch(batch, chunk_pool):
+    """
+    Extract the pages of the batch (on Ray) and chunk them (on the process pool), each interaction as soon as its
+    own pages are extracted.
+    """
+    search_results_list = [dedup_search_results(d["search_results"]) for d in batch]
+    futures = {
+        i: chunk_pool.submit(chunk_pages, batch[i]["query"], pages, len(search_results_list[i]) > 5)
+        for i, pages in iter_pages_batch(search_results_list)
     }
-)
-
-all_data = []
-with bz2.open('data/crag_task_1_dev_v3_release.jsonl.bz2', "rt") as f:
-    for line in f:
-        all_data.append(json.loads(line))
-
-batch_size = 5
-bacth_data = []
-for i, data in tqdm(enumerate(all_data)):
-    d = {"interaction_id": data["interaction_id"], "search_results": data["search_results"], "query": data["query"]}
-    if i % batch_size == 0:
-        bacth_data.append([d])
+    return [futures[i].result() for i in range(len(batch))]
+
+
+def main():
+    args = parse_args()
+    index_path = args.index_path or f"models/retrieve/flat_index/{args.collection}"
+    checkpoint_path = args.checkpoint or f"models/retrieve/cache/build_{args.collection}.done"
+
+    # embeddings = OpenAIEmbeddings(api_key="<your-api-key>", base_url="<your-base-url>")
+    if args.model_backend == "onnx":
+        from models.onnx_backend import ONNXEmbedding
+        embeddings = ONNXEmbedding(args.embedding_model, num_threads=args.num_threads, embed_batch_size=args.embed_batch_size)
     else:
-        bacth_data[-1].append(d)
+        embeddings = HuggingFaceBgeEmbeddings(
+            model_name=args.embedding_model,
+            model_kwargs = {'device': args.device},
+            encode_kwargs = {'normalize_embeddings': True, 'batch_size': args.embed_batch_size}, # set True to compute cosine similarity
+            query_instruction = "",
+        )
+    # Chunks already embedded by the online retriever or a previous build are read from the embedding cache,
+    # in the namespace of the model backend
+    embeddings = CachedEmbeddings(embeddings, get_embedding_cache(args.embedding_model, args.model_backend))
 
-build_docs = RunnableLambda(lambda x: [Document(chunk, metadata={"interaction_id": x['interaction_id']}) for chunk in get_all_chunks(x['query'], x['search_results'])])
+    if args.restart:
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        if args.backend == "flat" and os.path.exists(index_path):
+            shutil.rmtree(index_path)
 
-for data in tqdm(bacth_data):
-    docs = []
-    for doc in build_docs.batch(data):
-        docs.extend(doc)
-    if vectorstore is None:
-        vectorstore = Milvus.from_documents(
-            docs,
+    if args.backend == "flat":
+        writer = FlatIndexWriter(index_path, model_name=get_embedding_model_name(args.embedding_model, args.model_backend), quantization=args.quantization, float_vectors=args.float_vectors)
+        done = set(writer.interaction_ids)
+    else:
+        done = set()
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                done = set(line.strip() for line in f if line.strip() != "")
+        # The collection is only dropped on a fresh build, a resumed build appends to it
+        vectorstore = Milvus(
             embeddings,
-            connection_args={"uri": uri},
-            collection_name=collection_name,
+            connection_args={"uri": args.uri},
+            collection_name=args.collection,
             partition_key_field="interaction_id",
-            drop_old=True,
+            drop_old=len(done) == 0,
+            auto_id=True,
             index_params={
                 "metric_type": "IP",
-                "index_type": "IVF_FLAT",
+                "index_type": "IVF_FLAT" if args.quantization is None else "IVF_SQ8",
                 "params": {
                     "nlist": 65536
                 }
             }
         )
-    else:
-        vectorstore.add_documents(docs)
+        os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+        checkpoint = open(checkpoint_path, "a")
+    resumed = len(done) > 0
+    if resumed:
+        print(f"Resuming the build, {len(done)} interactions already done.")
+
+    init_ray(args.num_cpus)
+    chunk_pool = ProcessPoolExecutor(max_workers=args.num_workers, mp_context=multiprocessing.get_context("spawn"))
+    prefetch = ThreadPoolExecutor(max_workers=1)
+    batches = read_batches(read_interactions(args.input), args.batch_size, done)
+    num_chunks = 0
+    progress = tqdm(unit="interactions")
+
+    # The next batch is extracted and chunked while the current one is embedded and written
+    batch = next(batches, None)
+    future = prefetch.submit(prepare_batch, batch, chunk_pool) if batch is not None else None
+    while batch is not None:
+        chunks_list = future.result()
+        next_batch = next(batches, None)
+        if next_batch is not None:
+            future = prefetch.submit(prepare_batch, next_batch, chunk_pool)
+
+        # The chunks of the whole batch are embedded together
+        all_chunks = [chunk for chunks in chunks_list for chunk in chunks]
+        all_embeddings = embeddings.embed_documents(all_chunks) if len(all_chunks) > 0 else []
+        if args.backend == "flat":
+            start = 0
+            for d, chunks in zip(batch, chunks_list):
+                writer.add(d["interaction_id"], chunks, all_embeddings[start:start + len(chunks)])
+                start += len(chunks)
+        else:
+            interaction_ids = [d["interaction_id"] for d in batch]
+            if resumed:
+                # Rows of an interrupted batch may have been inserted without being checkpointed
+                vectorstore.delete(expr=f"interaction_id in {json.dumps(interaction_ids)}")
+            if len(all_chunks) > 0:
+                metadatas = [{"interaction_id": d["interaction_id"]} for d, chunks in zip(batch, chunks_list) for _ in chunks]
+                vectorstore.add_embeddings(all_chunks, all_embeddings, metadatas=metadatas)
+            checkpoint.write("".join(interaction_id + "\n" for interaction_id in interaction_ids))
+            checkpoint.flush()
+        num_chunks += len(all_chunks)
+        progress.update(len(batch))
+        progress.set_postfix(chunks=num_chunks)
+        batch = next_batch
+
+    progress.close()
+    prefetch.shutdown()
+    chunk_pool.shutdown()
+
+    # Test
+    first = next(read_interactions(args.input), None)
+    if first is not None:
+        if args.backend == "flat":
+            writer.close()
+            index = FlatIndex(index_path)
+            print(index.get_texts(first["interaction_id"], range(min(4, index.interactions.get(first["interaction_id"], (0, 0))[1]))))
+        else:
+            checkpoint.close()
+            print(vectorstore.similarity_search(first["query"], expr=f"interaction_id == '{first['interaction_id']}'"))
 
 
-# Test
-query = all_data[0]["query"]
-interaction_id = all_data[0]["interaction_id"]
-print(vectorstore.similarity_search(query, expr=f"interaction_id == '{interaction_id}'"))
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import os
+import json
+import fcntl
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_CACHE_DIR = os.getenv("CRAG_EMBEDDING_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "embeddings"))
+# Chunking of the online retriever and the vector db builders, part of the namespace of the cached embeddings
+CHUNK_PARAMS = {"chunk_size": 256, "chunk_overlap": 20}
+
+
+def text_key(text, kind="text"):
+    return hashlib.sha256((kind + "\0" + text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent cache of L2 normalized embeddings, keyed by the sha256 of the text.
+    The embeddings are rows of an append-only float16 matrix read through a memory map, and a SQLite table maps
+    each key to its row. The cache is namespaced by the embedding model path and the chunking parameters, so
+    changing either starts a new cache. Appends are serialized across processes with a file lock, so the online
+    retriever and the builders can share it.
+
+    Example:
+        cache = EmbeddingCache("models/retrieve/embedding_models/bge-m3", CHUNK_PARAMS)
+        embeddings = cache.embed(texts, lambda texts: model.encode(texts))
+    """
+    def __init__(self, model_name, chunk_params=None, cache_dir=EMBEDDING_CACHE_DIR):
+        namespace = json.dumps({"model": model_name, "chunk": chunk_params}, sort_keys=True)
+        self.model_name = model_name
+        self.chunk_params = chunk_params
+        self.dir = os.path.join(cache_dir, hashlib.sha256(namespace.encode("utf-8")).hexdigest()[:16])
+        os.makedirs(self.dir, exist_ok=True)
+        self.vectors_path = os.path.join(self.dir, "vectors.f16")
+        self.meta_path = os.path.join(self.dir, "meta.json")
+        self.lock_path = os.path.join(self.dir, "lock")
+        self.index_path = os.path.join(self.dir, "index.sqlite")
+        if not os.path.exists(self.meta_path):
+            with open(self.meta_path, "w") as f:
+                json.dump({"model": model_name, "chunk": chunk_params, "dim": None}, f)
+        self.dim = None
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.index_path, timeout=60)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS rows (key TEXT PRIMARY KEY, row INTEGER)")
+        conn.commit()
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _load_dim(self):
+        if self.dim is None:
+            with open(self.meta_path) as f:
+                self.dim = json.load(f)["dim"]
+        return self.dim
+
+    def _get_vectors(self, max_row):
+        # Remap the matrix if rows were appended (by this or another process) since it was mapped
+        if self._vectors is None or max_row >= len(self._vectors):
+            num_rows = os.path.getsize(self.vectors_path) // (self.dim * 2)
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float16, mode="r", shape=(num_rows, self.dim))
+        return self._vectors
+
+    def get_many(self, keys):
+        """
+        Returns a dict of the float32 embeddings of the keys found in the cache.
+        """
+        if len(keys) == 0 or self._load_dim() is None:
+            self.misses += len(keys)
+            return {}
+        conn = self._connect()
+        rows = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            rows.update(conn.execute(
+                f"SELECT key, row FROM rows WHERE key IN ({','.join('?' * len(batch))})", batch
+            ).fetchall())
+        self.hits += len(rows)
+        self.misses += len(keys) - len(rows)
+        if len(rows) == 0:
+            return {}
+        with self._lock:
+            vectors = self._get_vectors(max(rows.values()))
+            return {key: np.asarray(vectors[row], dtype=np.float32) for key, row in rows.items()}
+
+    def set_many(self, keys, embeddings):
+        """
+        Appends the embeddings (one row per key) of the keys which are not cached yet.
+        """
+        if len(keys) == 0:
+            return
+        embeddings = np.asarray(embeddings, dtype=np.float16)
+        with self._lock, open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if self._load_dim() is None:
+                    self.dim = embeddings.shape[1]
+                    with open(self.meta_path, "w") as f:
+                        json.dump({"model": self.model_name, "chunk": self.chunk_params, "dim": self.dim}, f)
+                conn = self._connect()
+                # Another process may have added some of the keys since they were looked up
+                cached = set()
+                for start in range(0, len(keys), 500):
+                    batch = keys[start:start + 500]
+                    cached.update(key for key, in conn.execute(
+                        f"SELECT key FROM rows WHERE key IN ({','.join('?' * len(batch))})", batch
+                    ))
+                new = {}
+                for i, key in enumerate(keys):
+                    if key not in cached and key not in new:
+                        new[key] = i
+                if len(new) == 0:
+                    return
+                with open(self.vectors_path, "ab") as f:
+                    # A partially written row of an interrupted append is overwritten
+                    num_rows = f.seek(0, os.SEEK_END) // (self.dim * 2)
+                    f.truncate(num_rows * self.dim * 2)
+                    f.seek(num_rows * self.dim * 2)
+                    f.write(np.ascontiguousarray(embeddings[list(new.values())]).tobytes())
+                    f.flush()
+                with conn:
+                    conn.executemany("INSERT OR IGNORE INTO rows (key, row) VALUES (?, ?)",
+                                     [(key, num_rows + j) for j, key in enumerate(new)])
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def embed(self, texts, encode, kind="text"):
+        """
+        Returns the float32 embeddings of the texts, only the texts missing from the cache are passed to `encode`
+        (which returns their normalized embeddings).
+        """
+        keys = [text_key(text, kind) for text in texts]
+        cached = self.get_many(list(dict.fromkeys(keys)))
+        missing = list(dict.fromkeys(key for key in keys if key not in cached))
+        if len(missing) > 0:
+            key2text = dict(zip(keys, texts))
+            embeddings = np.asarray(encode([key2text[key] for key in missing]), dtype=np.float32)
+            self.set_many(missing, embeddings)
+            cached.update(zip(missing, embeddings))
+        if len(keys) == 0:
+            return np.zeros((0, self._load_dim() or 0), dtype=np.float32)
+        return np.stack([cached[key] for key in keys])
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else 0.0,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    LangChain embeddings served from an EmbeddingCache, the wrapped embeddings are only called on misses.
+    """
+    def __init__(self, embeddings, cache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        return self.cache.embed(texts, self.embeddings.embed_documents).tolist()
+
+    def embed_query(self, text):
+        return self.cache.embed([text], lambda texts: [self.embeddings.embed_query(texts[0])], kind="query")[0].tolist()
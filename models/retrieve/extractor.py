@@ -0,0 +1,154 @@
+import time
+import queue
+import logging
+import resource
+import threading
+import multiprocessing
+import newspaper
+from bs4 import BeautifulSoup
+
+
+def html2txt(html):
+    if html is None or html.strip() == "":
+        return ""
+    article = newspaper.Article('')
+    article.set_html(html)
+    try:
+        article.parse()
+        return article.text
+    except:
+        soup = BeautifulSoup(
+            html, features="html.parser"
+        )
+        text = soup.get_text()
+        return text.replace("\n", " ")
+
+
+def _get_rss_mb():
+    # Peak resident set size of the process (KB on Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _worker_loop(conn, max_tasks, max_rss_mb):
+    num_tasks = 0
+    while True:
+        try:
+            html = conn.recv()
+        except EOFError:
+            return
+        start = time.perf_counter()
+        text = html2txt(html)
+        num_tasks += 1
+        retire = num_tasks >= max_tasks or _get_rss_mb() > max_rss_mb
+        conn.send((text, time.perf_counter() - start, retire))
+        if retire:
+            return
+
+
+class _Worker:
+    def __init__(self, ctx, max_tasks, max_rss_mb):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_loop, args=(child_conn, max_tasks, max_rss_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        self.conn.close()
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+
+
+class HTMLExtractor:
+    """
+    Extracts text from HTML pages in worker processes. Unlike a thread, a worker stuck on a pathological page
+    is killed once the page exceeds its deadline, and replaced by a fresh one. Workers are also recycled after
+    `max_tasks_per_worker` pages or once their RSS exceeds `max_rss_mb`.
+
+    Timeouts and per-page parse times are collected in `stats()`.
+    """
+    def __init__(self, num_workers=1, timeout=20, max_tasks_per_worker=500, max_rss_mb=2048, start_method="spawn"):
+        self.timeout = timeout
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.max_rss_mb = max_rss_mb
+        self.ctx = multiprocessing.get_context(start_method)
+        self.idle_workers = queue.Queue()
+        for _ in range(num_workers):
+            self.idle_workers.put(self._start_worker())
+        self.num_pages = 0
+        self.num_timeouts = 0
+        self.num_recycled = 0
+        self.total_parse_time = 0.0
+        self.max_parse_time = 0.0
+        self._lock = threading.Lock()
+
+    def _start_worker(self):
+        return _Worker(self.ctx, self.max_tasks_per_worker, self.max_rss_mb)
+
+    def extract(self, html, timeout=None):
+        return self.extract_with_info(html, timeout)[0]
+
+    def extract_with_info(self, html, timeout=None):
+        """
+        Returns (text, parse time in seconds, whether the page timed out). The text is empty on timeout.
+        """
+        if html is None or html.strip() == "":
+            return "", 0.0, False
+        timeout = self.timeout if timeout is None else timeout
+        worker = self.idle_workers.get()
+        start = time.perf_counter()
+        text, parse_time, timed_out, retire = "", 0.0, False, False
+        try:
+            worker.conn.send(html)
+            if worker.conn.poll(timeout):
+                text, parse_time, retire = worker.conn.recv()
+            else:
+                timed_out = True
+                parse_time = time.perf_counter() - start
+                logging.warning(f"HTML extraction timed out after {timeout}s ({len(html)} chars), killing the worker")
+        except (EOFError, OSError) as e:
+            # The worker died (e.g. out of memory) while parsing the page
+            logging.warning(f"HTML extraction worker failed: {e!r}")
+            retire = True
+            parse_time = time.perf_counter() - start
+        finally:
+            if timed_out or retire:
+                worker.kill()
+                worker = self._start_worker()
+            self.idle_workers.put(worker)
+
+        with self._lock:
+            self.num_pages += 1
+            self.num_timeouts += int(timed_out)
+            self.num_recycled += int(timed_out or retire)
+            self.total_parse_time += parse_time
+            self.max_parse_time = max(self.max_parse_time, parse_time)
+        return text, parse_time, timed_out
+
+    def stats(self):
+        return {
+            "pages": self.num_pages,
+            "timeouts": self.num_timeouts,
+            "recycled_workers": self.num_recycled,
+            "mean_parse_time": self.total_parse_time / self.num_pages if self.num_pages > 0 else 0.0,
+            "max_parse_time": self.max_parse_time,
+        }
+
+    def close(self):
+        while not self.idle_workers.empty():
+            self.idle_workers.get().kill()
+
+
+_html_extractor = None
+_html_extractor_lock = threading.Lock()
+
+
+def get_html_extractor():
+    """
+    The extractor of the current process, created on first use.
+    """
+    global _html_extractor
+    with _html_extractor_lock:
+        if _html_extractor is None:
+            _html_extractor = HTMLExtractor()
+    return _html_extractor
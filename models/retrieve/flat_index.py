@@ -0,0 +1,216 @@
+import os
+import json
+import numpy as np
+from models.retrieve.quantization import QUANTIZATIONS, quantize_int8, quantize_binary, int8_scores, binary_scores, top_k_indices, rescore_top_k
+
+
+class FlatIndexWriter:
+    """
+    Writes a flat index: the chunks of each interaction are stored contiguously, as rows of a float16 matrix of
+    L2 normalized embeddings (vectors.f16), with their texts in a UTF-8 sidecar (texts.bin, with the end byte offset
+    of each row in text_ends.i64). interactions.jsonl maps each interaction_id to its first row and number of rows,
+    and is written last, so an interaction is only part of the index once all its rows are written. Reopening an
+    existing index appends to it, after dropping the rows of an interaction whose write was interrupted.
+
+    With `quantization="int8"` (int8 codes in vectors.i8, one float32 scale per row in scales.f32, d + 4 bytes per
+    row) or "binary" (sign bits in vectors.b1, d / 8 bytes per row), searches scan the quantized rows and only
+    rescore the best candidates with the float16 rows (2d bytes per row). The float16 rows are then stored as well,
+    so the index is larger on disk and the saving is in the pages read per search. With `float_vectors=False`
+    they are not stored, the index is 2x (int8) or 16x (binary) smaller than a float16 one and searches rank by
+    the quantized scores only.
+
+    Example:
+        with FlatIndexWriter("models/retrieve/flat_index/crag_dev_v3", model_name=embedding_model_path) as writer:
+            writer.add(interaction_id, chunks, embeddings)
+    """
+    def __init__(self, path, model_name=None, quantization=None, float_vectors=True):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization: {quantization}, expected one of {QUANTIZATIONS}")
+        if quantization is None and not float_vectors:
+            raise ValueError("An index without quantization needs its float vectors")
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {"model": model_name, "dim": None, "dtype": "float16", "quantization": quantization, "float_vectors": float_vectors}
+            with open(self.meta_path, "w") as f:
+                json.dump(self.meta, f)
+        self.interaction_ids = set()
+        self.num_rows, self.text_end = self._recover()
+        self.quantization = self.meta.get("quantization")
+        self.float_vectors = self.meta.get("float_vectors", True)
+        self.vectors = open(os.path.join(path, "vectors.f16"), "ab") if self.float_vectors else None
+        self.codes = open(os.path.join(path, "vectors.i8"), "ab") if self.quantization == "int8" else None
+        self.scales = open(os.path.join(path, "scales.f32"), "ab") if self.quantization == "int8" else None
+        self.bits = open(os.path.join(path, "vectors.b1"), "ab") if self.quantization == "binary" else None
+        self.texts = open(os.path.join(path, "texts.bin"), "ab")
+        self.text_ends = open(os.path.join(path, "text_ends.i64"), "ab")
+        self.interactions = open(os.path.join(path, "interactions.jsonl"), "a")
+
+    def _recover(self):
+        """
+        Truncate the files to the rows of the interactions recorded in interactions.jsonl, dropping whatever an
+        interrupted build wrote after the last complete interaction. Returns the number of rows and of text bytes.
+        """
+        interactions_path = os.path.join(self.path, "interactions.jsonl")
+        num_rows = 0
+        if os.path.exists(interactions_path):
+            with open(interactions_path, "rb") as f:
+                data = f.read()
+            complete = data[:data.rfind(b"\n") + 1]
+            for line in complete.decode("utf-8").splitlines():
+                item = json.loads(line)
+                self.interaction_ids.add(item["interaction_id"])
+                num_rows = max(num_rows, item["start"] + item["count"])
+            if len(complete) < len(data):
+                os.truncate(interactions_path, len(complete))
+        text_ends_path = os.path.join(self.path, "text_ends.i64")
+        text_end = 0
+        if num_rows > 0:
+            text_end = int(np.fromfile(text_ends_path, dtype=np.int64, count=1, offset=(num_rows - 1) * 8)[0])
+        dim = self.meta["dim"] or 0
+        sizes = {
+            "vectors.f16": num_rows * dim * 2, "vectors.i8": num_rows * dim, "scales.f32": num_rows * 4,
+            "vectors.b1": num_rows * ((dim + 7) // 8), "texts.bin": text_end, "text_ends.i64": num_rows * 8,
+        }
+        for name, size in sizes.items():
+            file_path = os.path.join(self.path, name)
+            if os.path.exists(file_path) and os.path.getsize(file_path) > size:
+                os.truncate(file_path, size)
+        return num_rows, text_end
+
+    def add(self, interaction_id, texts, embeddings):
+        if len(texts) > 0:
+            embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1)
+            if self.meta["dim"] is None:
+                self.meta["dim"] = embeddings.shape[1]
+                with open(self.meta_path, "w") as f:
+                    json.dump(self.meta, f)
+            norms = np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+            embeddings = embeddings / norms
+            if self.float_vectors:
+                self.vectors.write(embeddings.astype(np.float16).tobytes())
+            if self.quantization == "int8":
+                codes, scales = quantize_int8(embeddings)
+                self.codes.write(codes.tobytes())
+                self.scales.write(scales.tobytes())
+            elif self.quantization == "binary":
+                self.bits.write(quantize_binary(embeddings).tobytes())
+            ends = []
+            for text in texts:
+                data = text.encode("utf-8")
+                self.texts.write(data)
+                self.text_end += len(data)
+                ends.append(self.text_end)
+            self.text_ends.write(np.array(ends, dtype=np.int64).tobytes())
+            for f in self._files():
+                f.flush()
+        self.interactions.write(json.dumps({"interaction_id": interaction_id, "start": self.num_rows, "count": len(texts)}) + "\n")
+        self.interactions.flush()
+        self.interaction_ids.add(interaction_id)
+        self.num_rows += len(texts)
+
+    def _files(self):
+        return [f for f in (self.vectors, self.codes, self.scales, self.bits, self.texts, self.text_ends) if f is not None]
+
+    def close(self):
+        for f in self._files() + [self.interactions]:
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FlatIndex:
+    """
+    Reads a flat index written by FlatIndexWriter. The matrices are memory mapped, so opening the index is
+    instant and the pages are shared by all the processes through the OS page cache.
+    Search is exact: the query is scored against the rows of its interaction only.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.dim = self.meta["dim"]
+        self.interactions = {}
+        with open(os.path.join(path, "interactions.jsonl")) as f:
+            for line in f:
+                item = json.loads(line)
+                self.interactions[item["interaction_id"]] = (item["start"], item["count"])
+        num_rows = max((start + count for start, count in self.interactions.values()), default=0)
+        self.float_vectors = self.meta.get("float_vectors", True)
+        self.vectors = self._memmap("vectors.f16", np.float16, (num_rows, self.dim or 0)) if self.float_vectors else None
+        self.text_ends = self._memmap("text_ends.i64", np.int64, (num_rows,))
+        self.texts = self._memmap("texts.bin", np.uint8, None)
+        self.quantization = self.meta.get("quantization")
+        if self.quantization == "int8":
+            self.codes = self._memmap("vectors.i8", np.int8, (num_rows, self.dim or 0))
+            self.scales = self._memmap("scales.f32", np.float32, (num_rows,))
+        elif self.quantization == "binary":
+            self.bits = self._memmap("vectors.b1", np.uint8, (num_rows, ((self.dim or 0) + 7) // 8))
+
+    def _memmap(self, name, dtype, shape):
+        path = os.path.join(self.path, name)
+        if os.path.getsize(path) == 0 or (shape is not None and shape[0] == 0):
+            return np.zeros(shape if shape is not None else (0,), dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+    def __contains__(self, interaction_id):
+        return interaction_id in self.interactions
+
+    def __len__(self):
+        return len(self.interactions)
+
+    def get_rows(self, interaction_id):
+        """
+        Slice of the rows of the interaction (empty if it is not in the index).
+        """
+        start, count = self.interactions.get(interaction_id, (0, 0))
+        return slice(start, start + count)
+
+    def scores(self, interaction_id, query_embedding, idx=None):
+        """
+        Inner products of the (normalized) query embedding with the chunks of the interaction (only the chunks at
+        `idx` if given). Without float vectors, the scores are the quantized ones.
+        """
+        rows = self.get_rows(interaction_id)
+        idx = slice(None) if idx is None else idx
+        if self.quantization == "int8" and not self.float_vectors:
+            return int8_scores(self.codes[rows][idx], self.scales[rows][idx], query_embedding)
+        if self.quantization == "binary" and not self.float_vectors:
+            return binary_scores(self.bits[rows][idx], query_embedding)
+        return self.vectors[rows][idx].astype(np.float32) @ np.asarray(query_embedding, dtype=np.float32)
+
+    def search(self, interaction_id, query_embedding, top_k, rescore_multiplier=4):
+        """
+        Indices of the top_k chunks of the interaction. On a quantized index, the `top_k * rescore_multiplier`
+        best chunks by quantized scores are rescored with the float16 vectors, if the index has them.
+        """
+        rows = self.get_rows(interaction_id)
+        if not self.float_vectors:
+            return top_k_indices(self.scores(interaction_id, query_embedding), top_k)
+        if self.quantization == "int8":
+            candidate_scores = int8_scores(self.codes[rows], self.scales[rows], query_embedding)
+        elif self.quantization == "binary":
+            candidate_scores = binary_scores(self.bits[rows], query_embedding)
+        else:
+            return top_k_indices(self.scores(interaction_id, query_embedding), top_k)
+        return rescore_top_k(candidate_scores, lambda idx: self.scores(interaction_id, query_embedding, idx), top_k, rescore_multiplier)
+
+    def get_texts(self, interaction_id, idx):
+        """
+        Texts of the chunks of the interaction at the given indices (relative to the first row of the interaction).
+        """
+        rows = self.get_rows(interaction_id)
+        texts = []
+        for i in idx:
+            row = rows.start + int(i)
+            start = int(self.text_ends[row - 1]) if row > 0 else 0
+            texts.append(bytes(self.texts[start:int(self.text_ends[row])]).decode("utf-8"))
+        return texts
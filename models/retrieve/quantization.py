@@ -0,0 +1,57 @@
+import numpy as np
+
+QUANTIZATIONS = (None, "int8", "binary")
+
+
+def quantize_int8(embeddings):
+    """
+    Symmetric scalar quantization with one scale per row: x ~= codes * scales[:, None].
+    Returns the int8 codes (n, dim) and the float32 scales (n,).
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    scales = np.abs(embeddings).max(axis=1) / 127
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(embeddings / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def quantize_binary(embeddings):
+    """
+    One bit per dimension (the sign), packed: (n, dim / 8) uint8.
+    """
+    return np.packbits(np.asarray(embeddings) > 0, axis=1)
+
+
+def int8_scores(codes, scales, query_embedding):
+    # The query is kept in full precision (asymmetric distance)
+    return (codes.astype(np.float32) @ np.asarray(query_embedding, dtype=np.float32)) * scales
+
+
+def binary_scores(bits, query_embedding):
+    # Dot product of the query with the {-1, +1} signs of the rows
+    query_embedding = np.asarray(query_embedding, dtype=np.float32)
+    signs = np.unpackbits(bits, axis=1, count=len(query_embedding)).astype(np.float32) * 2 - 1
+    return signs @ query_embedding
+
+
+def top_k_indices(scores, k):
+    """
+    Indices of the k highest scores, in descending order of score.
+    """
+    if k < len(scores):
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(len(scores))
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+def rescore_top_k(candidate_scores, rescore, k, rescore_multiplier=4):
+    """
+    Take the `k * rescore_multiplier` best candidates by their quantized scores, then return the indices of the
+    k best ones by `rescore(idx)`, their full precision scores.
+    """
+    candidates = top_k_indices(candidate_scores, k * rescore_multiplier)
+    if len(candidates) == 0:
+        return candidates
+    return candidates[top_k_indices(np.asarray(rescore(candidates), dtype=np.float32), k)]
+
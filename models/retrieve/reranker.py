@@ -0,0 +1,110 @@
+import time
+import hashlib
+import numpy as np
+import torch
+from sentence_transformers import CrossEncoder
+from models.cache import LRUCache, SQLiteCache
+
+
+class BatchReranker:
+    """
+    Reranks the candidates of a whole batch of queries with one cross-encoder pass.
+    All (query, candidate) pairs of the batch are sorted by length and scored in mini-batches of `batch_size`
+    under fp16/bf16 autocast, then the scores are split back per query.
+    Scores are cached by (model, query, candidate), in memory and optionally in a SQLite database at `cache_path`,
+    only the pairs missing from the cache are sent to the model.
+
+    Example:
+        reranker = BatchReranker("models/retrieve/reranker_models/bge-reranker-v2-m3", top_n=5)
+        reranked = reranker.rerank_batch(queries, candidates_list)  # the top_n candidates of each query, best first
+    """
+    def __init__(self, model_path, top_n, device="cuda", batch_size=64, max_length=512, dtype=torch.float16, cache_size=100000, cache_path=None, backend="torch", num_threads=None):
+        self.model_path = model_path
+        self.top_n = top_n
+        self.batch_size = batch_size
+        if backend == "onnx":
+            # CPU inference with an int8 ONNX export of the model (see models/onnx_backend.py)
+            from models.onnx_backend import ONNXCrossEncoder
+            self.device = torch.device("cpu")
+            self.dtype = None
+            self.model = ONNXCrossEncoder(model_path, num_threads=num_threads, max_length=max_length)
+        else:
+            self.device = torch.device(device) if device is not None else torch.device("cuda" if torch.cuda.is_available() else "cpu")
+            # fp16 autocast is only used on GPU, bf16 is supported on both
+            self.dtype = dtype if self.device.type == "cuda" or dtype == torch.bfloat16 else None
+            self.model = CrossEncoder(model_path, device=str(self.device), max_length=max_length)
+        self.cache = LRUCache(maxsize=cache_size, backend=SQLiteCache(cache_path) if cache_path is not None else None)
+        self.num_scored = 0
+        self.model_time = 0.0
+
+    def get_pair_key(self, query, candidate):
+        return hashlib.sha256(f"{self.model_path}\0{query}\0{candidate}".encode("utf-8")).hexdigest()
+
+    def score(self, pairs):
+        """
+        Returns the scores of the (query, candidate) pairs, in the order of `pairs`. Cached pairs are not scored again.
+        """
+        keys = [self.get_pair_key(query, candidate) for query, candidate in pairs]
+        scores = np.zeros(len(pairs), dtype=np.float32)
+        missing = {}
+        for i, key in enumerate(keys):
+            score = self.cache.get(key)
+            if score is None:
+                missing.setdefault(key, []).append(i)
+            else:
+                scores[i] = score
+        if len(missing) > 0:
+            start = time.perf_counter()
+            missing_scores = self.predict([pairs[indices[0]] for indices in missing.values()])
+            self.model_time += time.perf_counter() - start
+            self.num_scored += len(missing)
+            for indices, score in zip(missing.values(), missing_scores):
+                scores[indices] = score
+            # One transaction for all the new scores when the cache is persisted
+            self.cache.set_many({key: float(score) for key, score in zip(missing, missing_scores)})
+        return scores
+
+    def stats(self):
+        """
+        Cache hit rate, and model time saved by the hits (estimated from the mean time per scored pair).
+        """
+        stats = self.cache.stats()
+        stats["scored_pairs"] = self.num_scored
+        stats["model_time"] = self.model_time
+        stats["saved_model_time"] = stats["hits"] * self.model_time / self.num_scored if self.num_scored > 0 else 0.0
+        return stats
+
+    @torch.inference_mode()
+    def predict(self, pairs):
+        """
+        Scores the (query, candidate) pairs with the model, in the order of `pairs`.
+        """
+        scores = np.zeros(len(pairs), dtype=np.float32)
+        if len(pairs) == 0:
+            return scores
+        # Pairs of similar length are padded together
+        order = np.argsort([-(len(query) + len(candidate)) for query, candidate in pairs], kind="stable")
+        for start in range(0, len(pairs), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            with torch.autocast(device_type=self.device.type, dtype=self.dtype, enabled=self.dtype is not None):
+                batch_scores = self.model.predict(
+                    [pairs[i] for i in idx], batch_size=len(idx), show_progress_bar=False, convert_to_numpy=True
+                )
+            scores[idx] = np.asarray(batch_scores, dtype=np.float32).reshape(-1)
+        return scores
+
+    def rerank_batch(self, queries, candidates_list, top_n=None):
+        """
+        Returns the `top_n` candidates of each query sorted by descending score.
+        """
+        top_n = self.top_n if top_n is None else top_n
+        pairs = [(query, candidate) for query, candidates in zip(queries, candidates_list) for candidate in candidates]
+        scores = self.score(pairs)
+        results = []
+        start = 0
+        for candidates in candidates_list:
+            end = start + len(candidates)
+            order = np.argsort(-scores[start:end], kind="stable")[:top_n]
+            results.append([candidates[i] for i in order])
+            start = end
+        return results
@@ -1,160 +1,336 @@
+import os
 import html
-from bs4 import BeautifulSoup
+import logging
+import hashlib
+import functools
+import numpy as np
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from llama_index.core import VectorStoreIndex
 from llama_index.core.vector_stores import ExactMatchFilter, MetadataFilters
-from llama_index.core.schema import Document, QueryBundle
 from llama_index.core.node_parser import SentenceSplitter
-from llama_index.retrievers.bm25 import BM25Retriever
-from llama_index.core.postprocessor import SentenceTransformerRerank
+from llama_index.core.utils import get_tokenizer
 from llama_index.vector_stores.milvus import MilvusVectorStore
-import newspaper
 import ray
-import threading
-import logging
+from concurrent.futures import ThreadPoolExecutor
+from models.cache import SQLiteCache
+from models.retrieve.extractor import get_html_extractor
+from models.retrieve.bm25 import BM25
+from models.retrieve.reranker import BatchReranker
+from models.retrieve.flat_index import FlatIndex
+from models.retrieve.quantization import top_k_indices
+from models.retrieve.embedding_cache import EmbeddingCache, CHUNK_PARAMS
+
+# Extracted text of web pages, shared by the online retrievers and the vector db builders (and their Ray workers)
+HTML_CACHE_PATH = os.getenv("CRAG_HTML_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "html.sqlite"))
+HTML_CACHE_MAX_BYTES = int(os.getenv("CRAG_HTML_CACHE_MAX_BYTES", 8 * 1024 ** 3))
+html_cache = SQLiteCache(HTML_CACHE_PATH, max_bytes=HTML_CACHE_MAX_BYTES, compress=True)
+
+def get_page_key(html_text):
+    page = (html_text['page_result'] or "") + "\0" + (html_text['page_snippet'] or "")
+    return hashlib.sha256(page.encode("utf-8")).hexdigest()
 
-def html2txt(html):
-    if html is None or html.strip() == "":
-        return ""
-    article = newspaper.Article('')
-    article.set_html(html)
-    try:
-        article.parse()
-        return article.text
-    except:
-        soup = BeautifulSoup(
-            html, features="html.parser"
-        )
-        text = soup.get_text()
-        return text.replace("\n", " ")
-    
-def html2txt_with_timeout(html, timeout=20):
-    text = ""
-    def timeout_function():
-        nonlocal text
-        text = html2txt(html)
-    thread = threading.Thread(target=timeout_function)
-    thread.start()
-    thread.join(timeout)
-
-    if thread.is_alive():
-        logging.warning("Timeout occurred")
-    return text
-        
 @ray.remote
 def _extract_html(html_text):
     # Parse the HTML content
-    text = html2txt_with_timeout(html_text['page_result'])
+    text, _, timed_out = get_html_extractor().extract_with_info(html_text['page_result'])
     snippet = html.unescape(html_text['page_snippet'])
+    if not timed_out:
+        html_cache.set(get_page_key(html_text), [text, snippet])
     return text, snippet
 
-def get_all_chunks(query, search_results):
-    documents = []
+def init_ray(num_cpus=None):
+    """
+    Start Ray with an explicit CPU budget for HTML extraction, if it is not running yet.
+    """
+    if not ray.is_initialized():
+        ray.init(num_cpus=num_cpus)
+
+def iter_pages_batch(search_results_list):
+    """
+    Yields (i, pages) as soon as all the pages of query i are extracted, pages being the (text, snippet) of each of
+    its search results, so that a query can be chunked while the pages of the others are still being parsed.
+    All the pages of the batch are submitted at once, identical pages (same HTML and snippet) are extracted only once
+    across queries, and pages found in the cache are not parsed again.
+    """
+    init_ray()
+    keys_list = [[get_page_key(html_text) for html_text in search_results] for search_results in search_results_list]
+    unique_pages = {}
+    key2queries = {}
+    for i, (keys, search_results) in enumerate(zip(keys_list, search_results_list)):
+        for key, html_text in zip(keys, search_results):
+            unique_pages.setdefault(key, html_text)
+            key2queries.setdefault(key, set()).add(i)
+
+    pages = {key: tuple(page) for key, page in html_cache.get_many(list(unique_pages)).items()}
+    ref2key = {
+        _extract_html.remote(html_text): key
+        for key, html_text in unique_pages.items() if key not in pages
+    }
+    missing = [set(key for key in keys if key not in pages) for keys in keys_list]
+    for i, keys in enumerate(keys_list):
+        if len(missing[i]) == 0:
+            yield i, [pages[key] for key in keys]
+    pending = list(ref2key)
+    while len(pending) > 0:
+        ready, pending = ray.wait(pending, num_returns=1)
+        for ref in ready:
+            key = ref2key[ref]
+            pages[key] = ray.get(ref)
+            for i in key2queries[key]:
+                missing[i].discard(key)
+                if len(missing[i]) == 0:
+                    yield i, [pages[key] for key in keys_list[i]]
+
+def extract_pages_batch(search_results_list):
+    """
+    Returns the (text, snippet) of each search result of each query, see iter_pages_batch.
+    """
+    pages_list = [None] * len(search_results_list)
+    for i, pages in iter_pages_batch(search_results_list):
+        pages_list[i] = pages
+    return pages_list
+
+def extract_pages(search_results):
+    """
+    Returns the (text, snippet) of each search result.
+    """
+    return extract_pages_batch([search_results])[0]
+
+def dedup_search_results(search_results):
     # delete replicate search results
     page_urls = set()
-    search_results = [result for result in search_results if not (result['page_url'] in page_urls or page_urls.add(result['page_url']))]
+    return [result for result in search_results if not (result['page_url'] in page_urls or page_urls.add(result['page_url']))]
 
-    ray_response_refs = [
-        _extract_html.remote(
-            html_text
-        )
-        for html_text in search_results
-    ]
+@functools.lru_cache(maxsize=None)
+def get_chunk_splitter():
+    # Built once per process, with the tokenizer it counts tokens with
+    return SentenceSplitter(**CHUNK_PARAMS), get_tokenizer()
+
+@functools.lru_cache(maxsize=4096)
+def split_text(text):
+    """
+    Split a page (or snippet) into 256 token chunks. Returns the chunks and the token offset of each chunk in the
+    page (offsets[i] to offsets[i + 1]: the tokens of chunk i minus the up to chunk_overlap tokens it repeats from
+    chunk i - 1), cached as the same page is often returned for several queries.
+    """
+    splitter, tokenizer = get_chunk_splitter()
+    chunks = tuple(splitter.split_text(text))
+    lengths = np.array([len(tokenizer(chunk)) for chunk in chunks], dtype=np.int64)
+    lengths[1:] = np.maximum(lengths[1:] - CHUNK_PARAMS["chunk_overlap"], 0)
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(lengths)
+    return chunks, offsets
 
-    for response_ref in ray_response_refs:
-        text, snippet = ray.get(response_ref)  # Blocking call until parallel execution is complete
-        if len(text) > 0:
-            documents.append(Document(text=text))
-        if len(snippet) > 0:
-            documents.append(Document(text=snippet))
+def get_chunk_groups(pages, group_tokens=1024):
+    """
+    Groups of consecutive chunks of each page and snippet, of up to `group_tokens` tokens.
+    """
+    groups = []
+    for text, snippet in pages:
+        for document in (text, snippet):
+            if len(document) == 0:
+                continue
+            chunks, offsets = split_text(document)
+            start = 0
+            for i in range(1, len(chunks)):
+                if offsets[i + 1] - offsets[start] > group_tokens:
+                    groups.append(chunks[start:i])
+                    start = i
+            if start < len(chunks):
+                groups.append(chunks[start:])
+    return groups
 
+def chunk_pages(query, pages, prefilter=False, similarity_top_k=50):
+    """
+    Split the pages into 256 token chunks. With `prefilter`, only the chunks of the `similarity_top_k` best
+    groups of ~1024 tokens for the query according to BM25 are kept.
+    """
+    groups = get_chunk_groups(pages)
     ######################### pre-retrieval #########################
-    if len(search_results) > 5:
-        node_parser = SentenceSplitter(chunk_size=1024, chunk_overlap=20)
-        nodes = node_parser.get_nodes_from_documents(documents)
-        similarity_top_k = 50
-        if len(nodes) < 50:
-            print(f"Not enough nodes for BM25 retrieval. Using all nodes({len(nodes)}).")
-            similarity_top_k = len(nodes)
-        bm25_retriever = BM25Retriever.from_defaults(nodes=nodes, similarity_top_k=similarity_top_k)
-        nodes = bm25_retriever.retrieve(query)
-        texts = [node.get_text().strip() for node in nodes]
-    else:
-        texts = [node.get_text().strip() for node in documents]
-
-    ######################### retrieval #########################
-    node_parser = SentenceSplitter(chunk_size=256, chunk_overlap=20)
-    texts = node_parser.split_texts(texts)
-    return texts
+    if prefilter:
+        if len(groups) < similarity_top_k:
+            logging.debug(f"Not enough nodes for BM25 retrieval. Using all nodes({len(groups)}).")
+        bm25 = BM25([" ".join(group) for group in groups])
+        groups = [groups[i] for i in bm25.retrieve(query, similarity_top_k)]
+    return [chunk for group in groups for chunk in group]
+
+def get_all_chunks(query, search_results):
+    search_results = dedup_search_results(search_results)
+    return chunk_pages(query, extract_pages(search_results), prefilter=len(search_results) > 5)
+
+def encode_texts(embedding_model, texts, batch_size=128):
+    """
+    Embed the texts in batches sorted by length, so that each padded batch holds texts of similar length.
+    Returns a float32 matrix of L2 normalized embeddings, in the order of `texts`.
+    """
+    if len(texts) == 0:
+        return None
+    order = np.argsort([-len(text) for text in texts], kind="stable")
+    embeddings = None
+    for start in range(0, len(texts), batch_size):
+        idx = order[start:start + batch_size]
+        batch = np.asarray(embedding_model.get_text_embedding_batch([texts[i] for i in idx]), dtype=np.float32)
+        if embeddings is None:
+            embeddings = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+        embeddings[idx] = batch
+    return normalize(embeddings)
+
+def normalize(embeddings):
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+def load_embedding_model(embedding_model_path, device="cuda", embed_batch_size=128, backend="torch", num_threads=None):
+    """
+    backend: "torch" (HuggingFace model on `device`) or "onnx" (int8 ONNX export on CPU with `num_threads` threads)
+    """
+    if backend == "onnx":
+        from models.onnx_backend import ONNXEmbedding
+        return ONNXEmbedding(embedding_model_path, num_threads=num_threads, embed_batch_size=embed_batch_size)
+    return HuggingFaceEmbedding(model_name=embedding_model_path, device=device, embed_batch_size=embed_batch_size)
+
+def get_embedding_model_name(embedding_model_path, backend="torch"):
+    # The int8 ONNX model (quantized per CPU target) gives slightly different embeddings, they are cached and indexed separately
+    if backend == "torch":
+        return embedding_model_path
+    from models.onnx_backend import ONNX_CPU_TARGET, detect_cpu_target
+    return f"{embedding_model_path}#onnx-int8-{ONNX_CPU_TARGET or detect_cpu_target()}"
+
+def get_embedding_cache(embedding_model_path, backend="torch"):
+    return EmbeddingCache(get_embedding_model_name(embedding_model_path, backend), CHUNK_PARAMS)
 
 class Retriever:
-    def __init__(self, top_k, top_n, embedding_model_path, reranker_model_path=None, rerank=False, device="cuda"):
+    def __init__(self, top_k, top_n, embedding_model_path, reranker_model_path=None, rerank=False, device="cuda", num_cpus=None, embed_batch_size=128, use_embedding_cache=True, rerank_cache_path=None, backend="torch", num_threads=None):
+        # The chunk embeddings are computed per batch and searched in float32 while in memory, quantizing them
+        # would save no memory (see Retriever_Flat and Retriever_Milvus for quantized storage)
         self.top_k = top_k
         self.top_n = top_n
-        self.embedding_model = HuggingFaceEmbedding(
-            model_name=embedding_model_path, device=device
-        )
+        self.embedding_model_path = embedding_model_path
+        self.device = device
+        # "torch", or "onnx" for CPU-only nodes (int8 ONNX models with `num_threads` intra-op threads)
+        self.backend = backend
+        self.num_threads = num_threads
+        self.embed_batch_size = embed_batch_size
+        self._embedding_model = None
+        # Chunk and query embeddings are persisted on disk, shared with the vector db builders
+        self.embedding_cache = get_embedding_cache(embedding_model_path, backend) if use_embedding_cache else None
         self.rerank = rerank
         if self.rerank:
-            self.reranker = SentenceTransformerRerank(top_n=self.top_n, model=reranker_model_path, device=device)   
+            self.reranker = BatchReranker(reranker_model_path, top_n=self.top_n, device=device, cache_path=rerank_cache_path, backend=backend, num_threads=num_threads)
+        init_ray(num_cpus)
+
+    @property
+    def embedding_model(self):
+        # Loaded on first use, a batch served entirely from the embedding cache never loads the model
+        if self._embedding_model is None:
+            self._embedding_model = load_embedding_model(
+                self.embedding_model_path, self.device, self.embed_batch_size, self.backend, self.num_threads
+            )
+        return self._embedding_model
+
+    def encode_chunks(self, chunks):
+        encode = lambda texts: encode_texts(self.embedding_model, texts, self.embed_batch_size)
+        if self.embedding_cache is None or len(chunks) == 0:
+            return encode(chunks)
+        return self.embedding_cache.embed(chunks, encode)
+
+    def encode_queries(self, queries):
+        encode = lambda texts: normalize(np.asarray(
+            [self.embedding_model.get_query_embedding(text) for text in texts], dtype=np.float32
+        ))
+        if self.embedding_cache is None:
+            return encode(queries)
+        return self.embedding_cache.embed(queries, encode, kind="query")
     
     def retrieve(self, query, interaction_id, search_results):
-        documents = []
-        page_urls = set()
-        search_results = [result for result in search_results if not (result['page_url'] in page_urls or page_urls.add(result['page_url']))]
+        return self.retrieve_batch([query], [interaction_id], [search_results])[0]
 
-        ray_response_refs = [
-            _extract_html.remote(
-                html_text
-            )
-            for html_text in search_results
-        ]
-
-        for response_ref in ray_response_refs:
-            text, snippet = ray.get(response_ref)  # Blocking call until parallel execution is complete
-            if len(text) > 0:
-                documents.append(Document(text=text))
-            if len(snippet) > 0:
-                documents.append(Document(text=snippet))
-
-        ######################### pre-retrieval #########################
-        if len(search_results) > 5:
-            node_parser = SentenceSplitter(chunk_size=1024, chunk_overlap=20)
-            nodes = node_parser.get_nodes_from_documents(documents)
-            similarity_top_k = 50
-            if len(nodes) < 50:
-                print(f"Not enough nodes for BM25 retrieval. Using all nodes({len(nodes)}).")
-                similarity_top_k = len(nodes)
-            bm25_retriever = BM25Retriever.from_defaults(nodes=nodes, similarity_top_k=similarity_top_k)
-            nodes = bm25_retriever.retrieve(query)
-            documents = [Document(text=node.get_text().strip()) for node in nodes]       
+    def retrieve_batch(self, queries, interaction_ids, search_results_list):
+        """
+        The chunks of all the queries are embedded together in large length-sorted batches, then each query
+        gets its top_k chunks by a dot product against its own slice of the embedding matrix.
+        """
+        search_results_list = [dedup_search_results(search_results) for search_results in search_results_list]
+        # Each query is chunked as soon as its own pages are extracted
+        with ThreadPoolExecutor(max_workers=max(1, len(queries))) as executor:
+            futures = {
+                i: executor.submit(chunk_pages, queries[i], pages, len(search_results_list[i]) > 5)
+                for i, pages in iter_pages_batch(search_results_list)
+            }
+            chunks_list = [futures[i].result() for i in range(len(queries))]
 
         ######################### retrieval #########################
-        node_parser = SentenceSplitter(chunk_size=256, chunk_overlap=20)
-        nodes = node_parser.get_nodes_from_documents(documents)
-        index = VectorStoreIndex(nodes, embed_model=self.embedding_model)
-        retriever = index.as_retriever(similarity_top_k=self.top_k)
-        nodes = retriever.retrieve(query)
+        all_chunks = [chunk for chunks in chunks_list for chunk in chunks]
+        embeddings = self.encode_chunks(all_chunks)
+        query_embeddings = self.encode_queries(queries)
 
+        candidates_list = []
+        start = 0
+        for query_embedding, chunks in zip(query_embeddings, chunks_list):
+            end = start + len(chunks)
+            if end == start:
+                candidates_list.append([])
+                continue
+            top = top_k_indices(embeddings[start:end] @ query_embedding, self.top_k)
+            candidates_list.append([chunks[i] for i in top])
+            start = end
 
         ######################### rerank #########################
         if self.rerank:
-            reranked_nodes = self.reranker.postprocess_nodes(
-                nodes,
-                query_bundle=QueryBundle(query_str=query)
-            )
-            top_sentences = [node.get_text().strip() for node in reranked_nodes]
-        else:
-            top_sentences = [node.get_text().strip() for node in nodes]
-        return top_sentences
+            # The (query, candidate) pairs of all the queries are scored together
+            candidates_list = self.reranker.rerank_batch(queries, candidates_list)
+        return [[candidate.strip() for candidate in candidates] for candidates in candidates_list]
+
+class Retriever_Flat(Retriever):
+    """
+    Retrieves the chunks of an interaction from a local flat index (see flat_index.py) built by build_vector_db,
+    with an exact top_k over the rows of the interaction. No server is needed and the index is memory mapped.
+    """
+    def __init__(self, top_k, top_n, index_path, embedding_model_path, reranker_model_path=None, rerank=False, device="cuda", embed_batch_size=128, use_embedding_cache=True, rerank_cache_path=None, rescore_multiplier=4, backend="torch", num_threads=None):
+        self.top_k = top_k
+        self.top_n = top_n
+        # The quantization is the one the index was built with
+        self.index = FlatIndex(index_path)
+        # Query and chunk embeddings must come from the same model backend (build_vector_db --model-backend)
+        model_name = get_embedding_model_name(embedding_model_path, backend)
+        if self.index.meta["model"] is not None and self.index.meta["model"] != model_name:
+            raise ValueError(f"The index {index_path} was built with {self.index.meta['model']}, not {model_name}: rebuild it with the same --model-backend")
+        self.rescore_multiplier = rescore_multiplier
+        self.embedding_model_path = embedding_model_path
+        self.device = device
+        self.backend = backend
+        self.num_threads = num_threads
+        self.embed_batch_size = embed_batch_size
+        self._embedding_model = None
+        self.embedding_cache = get_embedding_cache(embedding_model_path, backend) if use_embedding_cache else None
+        self.rerank = rerank
+        if self.rerank:
+            self.reranker = BatchReranker(reranker_model_path, top_n=self.top_k, device=device, cache_path=rerank_cache_path, backend=backend, num_threads=num_threads)
+
+    def retrieve_batch(self, queries, interaction_ids, search_results_list):
+        query_embeddings = self.encode_queries(queries)
+        candidates_list = []
+        for interaction_id, query_embedding in zip(interaction_ids, query_embeddings):
+            top = self.index.search(interaction_id, query_embedding, self.top_n, self.rescore_multiplier)
+            candidates_list.append(self.index.get_texts(interaction_id, top))
+
+        ######################### rerank #########################
+        if self.rerank:
+            candidates_list = self.reranker.rerank_batch(queries, candidates_list)
+        return [[candidate.strip() for candidate in candidates] for candidates in candidates_list]
 
 class Retriever_Milvus:
-    def __init__(self, top_k, top_n, collection_name, uri, embedding_model_path, reranker_model_path=None, rerank=False, device="cuda"):
+    def __init__(self, top_k, top_n, collection_name, uri, embedding_model_path, reranker_model_path=None, rerank=False, device="cuda", rerank_cache_path=None, quantization=None, rescore_multiplier=4, backend="torch", num_threads=None):
+        if quantization not in (None, "int8"):
+            raise ValueError(f"Unknown quantization for Milvus: {quantization}, expected None or 'int8' (IVF_SQ8 index)")
         self.top_k = top_k
         self.top_n = top_n
-        self.embedding_model = HuggingFaceEmbedding(
-            model_name=embedding_model_path, device=device
-        )
+        # "int8" if the collection was built with an IVF_SQ8 index: top_n * rescore_multiplier candidates are rescored
+        # with the full precision embeddings of the embedding cache (filled by build_vector_db). The collection must
+        # have been built with the same model backend (build_vector_db --model-backend), Milvus does not record it
+        self.quantization = quantization
+        self.rescore_multiplier = rescore_multiplier
+        self.embedding_cache = get_embedding_cache(embedding_model_path, backend) if quantization is not None else None
+        self.embedding_model = load_embedding_model(embedding_model_path, device, backend=backend, num_threads=num_threads)
         vector_store = MilvusVectorStore(
             collection_name=collection_name,
             uri=uri,
@@ -164,22 +340,36 @@ class Retriever_Milvus:
         self.index = VectorStoreIndex.from_vector_store(vector_store, embed_model=self.embedding_model)
         self.rerank = rerank
         if self.rerank:
-            self.reranker = self.reranker = SentenceTransformerRerank(top_n=self.top_k, model=reranker_model_path, device=device)
-           
-    def retrieve(self, query, interaction_id, search_results):
-        metadata_filter = MetadataFilters(
-            filters=[ExactMatchFilter(key="interaction_id", value=f"{interaction_id}")]
-        )
-        retriever = self.index.as_retriever(similarity_top_k=self.top_n, filters=metadata_filter)
-        nodes = retriever.retrieve(query)
+            self.reranker = BatchReranker(reranker_model_path, top_n=self.top_k, device=device, cache_path=rerank_cache_path, backend=backend, num_threads=num_threads)
+
+    def retrieve_batch(self, queries, interaction_ids, search_results_list):
+        candidates_list = []
+        for query, interaction_id in zip(queries, interaction_ids):
+            metadata_filter = MetadataFilters(
+                filters=[ExactMatchFilter(key="interaction_id", value=f"{interaction_id}")]
+            )
+            similarity_top_k = self.top_n if self.quantization is None else self.top_n * self.rescore_multiplier
+            retriever = self.index.as_retriever(similarity_top_k=similarity_top_k, filters=metadata_filter)
+            nodes = retriever.retrieve(query)
+            candidates = [node.get_text() for node in nodes]
+            if self.quantization is not None and len(candidates) > 0:
+                candidates = [candidates[i] for i in self.rescore(query, candidates)]
+            candidates_list.append(candidates)
 
         ######################### rerank #########################
         if self.rerank:
-            reranked_nodes = self.reranker.postprocess_nodes(
-                nodes,
-                query_bundle=QueryBundle(query_str=query)
-            )
-            top_sentences = [node.get_text().strip() for node in reranked_nodes]
-        else:
-            top_sentences = [node.get_text().strip() for node in nodes]
-        return top_sentences
\ No newline at end of file
+            candidates_list = self.reranker.rerank_batch(queries, candidates_list)
+        return [[candidate.strip() for candidate in candidates] for candidates in candidates_list]
+           
+    def rescore(self, query, candidates):
+        """
+        Indices of the top_n candidates by their full precision scores.
+        """
+        embeddings = self.embedding_cache.embed(
+            candidates, lambda texts: normalize(np.asarray(self.embedding_model.get_text_embedding_batch(texts), dtype=np.float32))
+        )
+        query_embedding = normalize(np.asarray(self.embedding_model.get_query_embedding(query), dtype=np.float32))
+        return top_k_indices(embeddings @ query_embedding, self.top_n)
+
+    def retrieve(self, query, interaction_id, search_results):
+        return self.retrieve_batch([query], [interaction_id], [search_results])[0]
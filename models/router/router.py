@@ -1,5 +1,9 @@
+import os
+import glob
 import torch
+from safetensors import safe_open
 from transformers import (
+    AutoConfig,
     AutoModelForSequenceClassification,
     AutoTokenizer,
     BitsAndBytesConfig,
@@ -7,8 +11,13 @@ from transformers import (
 from peft import PeftModel
 
 class SequenceClassificationRouter:
-    def __init__(self, model_path, classes, device_map="auto", peft_path=None, use_bits_and_bytes=False, use_peft=False):
-        if use_bits_and_bytes:
+    def __init__(self, model_path, classes, device_map="auto", peft_path=None, use_bits_and_bytes=False, use_peft=False, backend="torch", num_threads=None):
+        if backend == "onnx":
+            # CPU inference with an int8 ONNX export of the model (see models/onnx_backend.py)
+            assert not use_bits_and_bytes and not use_peft, "The ONNX backend does not support bitsandbytes or PEFT models."
+            from models.onnx_backend import load_ort_model
+            self.model = load_ort_model(model_path, "text-classification", num_threads=num_threads)
+        elif use_bits_and_bytes:
             bnb_config = BitsAndBytesConfig(
                 load_in_4bit=True,
                 bnb_4bit_compute_dtype=torch.float16,
@@ -40,10 +49,141 @@ class SequenceClassificationRouter:
         self.tokenizer.pad_token = self.tokenizer.eos_token
 
     def __call__(self, text):
-        inputs = self.tokenizer(text, return_tensors="pt", padding=True, truncation=True)
-        inputs = {k: v.to(self.model.device) for k, v in inputs.items()}
-        outputs = self.model(**inputs)
-        logits = outputs.logits
-        predicted_class_idx = logits.argmax().item()
-        predicted_class = self.classes[predicted_class_idx]
-        return predicted_class
\ No newline at end of file
+        return self.route_batch([text])[0]
+
+    @torch.inference_mode()
+    def route_batch(self, texts, max_batch_size=32, return_probs=False):
+        """
+        Classify a list of texts, `max_batch_size` texts per forward pass.
+        Returns the predicted classes, and the class probabilities of each text if `return_probs` is True.
+        """
+        predicted_classes = []
+        probs = []
+        for start in range(0, len(texts), max_batch_size):
+            batch = texts[start:start + max_batch_size]
+            inputs = self.tokenizer(batch, return_tensors="pt", padding=True, truncation=True)
+            inputs = {k: v.to(self.model.device) for k, v in inputs.items()}
+            logits = self.model(**inputs).logits.float()
+            predicted_class_idxs = logits.argmax(dim=-1).tolist()
+            predicted_classes.extend([self.classes[idx] for idx in predicted_class_idxs])
+            if return_probs:
+                probs.extend(logits.softmax(dim=-1).tolist())
+        if return_probs:
+            return predicted_classes, probs
+        return predicted_classes
+
+
+def checkpoint_tensors(model_path):
+    """
+    name -> function loading the tensor, for the (safetensors or PyTorch) weights of a checkpoint, without reading them.
+    """
+    loaders = {}
+    files = sorted(glob.glob(os.path.join(model_path, "*.safetensors")))
+    if len(files) > 0:
+        for file in files:
+            f = safe_open(file, framework="pt", device="cpu")
+            for name in f.keys():
+                loaders[name] = lambda f=f, name=name: f.get_tensor(name)
+    else:
+        for file in sorted(glob.glob(os.path.join(model_path, "pytorch_model*.bin"))):
+            state_dict = torch.load(file, map_location="cpu", mmap=True, weights_only=True)
+            for name in state_dict:
+                loaders[name] = lambda state_dict=state_dict, name=name: state_dict[name]
+    assert len(loaders) > 0, f"No weights found in {model_path}."
+    return loaders
+
+
+def check_shared_encoder(encoder_path, model_path):
+    """
+    Raise if the encoder weights of the checkpoint `model_path` differ from the ones of `encoder_path`: its classifier
+    would be fed hidden states it was not trained on. Tensors are compared one at a time.
+    """
+    encoder_tensors = checkpoint_tensors(encoder_path)
+    for name, load in checkpoint_tensors(model_path).items():
+        if name.startswith("classifier."):
+            continue
+        if name not in encoder_tensors or not torch.equal(load(), encoder_tensors[name]()):
+            raise ValueError(
+                f"{model_path} was not trained on the encoder of {encoder_path} ({name} differs). "
+                "Fine-tune its head with that encoder frozen, or use one SequenceClassificationRouter per checkpoint."
+            )
+
+
+def load_classifier(model_path, num_labels, dtype, device):
+    """
+    Only the classifier head of a sequence classification checkpoint, the encoder weights are not loaded.
+    """
+    config = AutoConfig.from_pretrained(model_path, num_labels=num_labels)
+    with torch.device("meta"):
+        head = AutoModelForSequenceClassification.from_config(config).classifier
+    head = head.to_empty(device="cpu")
+    head.load_state_dict({name[len("classifier."):]: load() for name, load in checkpoint_tensors(model_path).items() if name.startswith("classifier.")})
+    return head.to(device=device, dtype=dtype)
+
+
+class MultiHeadSequenceClassificationRouter:
+    """
+    Several sequence classification heads sharing one encoder, so that all the heads are computed with a single encoder forward pass.
+    The encoder is loaded from `encoder_path` (defaults to the checkpoint of the first head). Heads coming from other checkpoints
+    only contribute their classifier, so they must have been trained against the shared encoder (e.g. with the encoder frozen):
+    their encoder weights are checked to be identical to the shared ones. The domain and dynamic checkpoints of
+    models/router/bge-m3 were fine-tuned separately and cannot be combined.
+
+    Args:
+        heads: list of (model_path, classes), e.g. [("models/router/bge-m3/domain", [...]), ("models/router/bge-m3/dynamic", [...])]
+    """
+    def __init__(self, heads, encoder_path=None, device_map="auto", backend="torch", num_threads=None):
+        assert len(heads) > 0, "At least one head is required."
+        encoder_path = heads[0][0] if encoder_path is None else encoder_path
+        for model_path, _ in heads:
+            if model_path != encoder_path:
+                check_shared_encoder(encoder_path, model_path)
+        if backend == "onnx":
+            # The encoder runs as an int8 ONNX export on CPU, only the heads are loaded in PyTorch (float32 on CPU)
+            from models.onnx_backend import load_ort_model
+            self.model = None
+            self.encoder = load_ort_model(encoder_path, "feature-extraction", num_threads=num_threads)
+            self.device = torch.device("cpu")
+            dtype = torch.float32
+        else:
+            self.model = AutoModelForSequenceClassification.from_pretrained(
+                encoder_path,
+                device_map=device_map,
+                torch_dtype=torch.bfloat16,
+            )
+            self.encoder = self.model.base_model
+            self.device = self.model.device
+            dtype = torch.bfloat16
+        self.heads = []
+        self.classes = []
+        for model_path, classes in heads:
+            if model_path == encoder_path and self.model is not None:
+                head = self.model.classifier
+            else:
+                head = load_classifier(model_path, len(classes), dtype, self.device)
+            head.eval()
+            self.heads.append(head)
+            self.classes.append(classes)
+        self.tokenizer = AutoTokenizer.from_pretrained(encoder_path)
+        self.tokenizer.pad_token = self.tokenizer.eos_token
+
+    def __call__(self, text):
+        return self.route_batch([text])[0]
+
+    @torch.inference_mode()
+    def route_batch(self, texts, max_batch_size=32):
+        """
+        Returns a tuple of predicted classes (one per head, in the order of `heads`) for each text.
+        """
+        routes = []
+        for start in range(0, len(texts), max_batch_size):
+            batch = texts[start:start + max_batch_size]
+            inputs = self.tokenizer(batch, return_tensors="pt", padding=True, truncation=True)
+            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+            hidden_states = self.encoder(**inputs)[0]
+            predictions = []
+            for head, classes in zip(self.heads, self.classes):
+                predicted_class_idxs = head(hidden_states).argmax(dim=-1).tolist()
+                predictions.append([classes[idx] for idx in predicted_class_idxs])
+            routes.extend(zip(*predictions))
+        return routes